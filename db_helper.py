@@ -422,9 +422,25 @@
 # db_helper.py — Updated to use raw_source table as primary storage
 import mysql.connector
 from mysql.connector import pooling, Error
+import atexit
+import functools
+import hashlib
+import os
 import time
+import tempfile
+import threading
+import warnings
 from datetime import datetime
+from itertools import chain
 import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+log = logging.getLogger(__name__)
 
 # Updated database configuration with remote credentials
 DB_CFG = dict(
@@ -435,22 +451,105 @@ DB_CFG = dict(
     database="traders_leads",
     auth_plugin="mysql_native_password",
     connect_timeout=30,
-    autocommit=False
+    autocommit=False,
+    # Match the raw_source table charset so the server never transcodes
+    charset="utf8mb4",
+    collation="utf8mb4_unicode_ci",
+    use_unicode=True,
+    # Required by save_to_raw_source_bulk (LOAD DATA LOCAL INFILE)
+    allow_local_infile=True,
+    # zlib protocol compression: raw_json payloads are large and the server is remote
+    compress=True,
+    # C extension protocol codec; fall back to pure Python if it isn't built
+    use_pure=not mysql.connector.HAVE_CEXT
 )
 
+if DB_CFG['use_pure']:
+    print("⚠️ mysql-connector C extension not available, using the slower pure Python driver")
+
 POOL_CFG = dict(
     pool_name="main_pool",
-    pool_size=10,
-    pool_reset_session=True
+    # One connection per saving thread: the main thread plus asyncio's
+    # default executor (min(32, cpu + 4) workers), capped at the connector's
+    # 32; past that the executor itself is capped (DB_WORKER_THREADS)
+    pool_size=min(32, (os.cpu_count() or 1) + 5),
+    # Connections are held per thread (see _conn), so skip the reset round-trip
+    pool_reset_session=False
+)
+
+# Worker threads that may hold a pooled connection alongside the main
+# thread. _conn() pins one connection per thread for the life of the
+# process, so callers running DB work in an executor (run_all.main) cap it
+# at this; a thread past the pool size would get "pool exhausted".
+DB_WORKER_THREADS = POOL_CFG['pool_size'] - 1
+
+# Columns added to raw_source after its first release: (name, definition)
+RAW_SOURCE_ADDED_COLUMNS = [
+    # SHA-1 of raw_json as sent, lets saves skip unchanged listings
+    ('raw_sha1', 'BINARY(20) AFTER raw_json'),
+    # Fixed 16-byte upsert key instead of the wide (source, listing_url) one
+    ('url_hash', "BINARY(16) GENERATED ALWAYS AS (UNHEX(MD5(CONCAT(source, '|', listing_url)))) STORED AFTER listing_url"),
+]
+
+# Extracted columns first released as STORED, now VIRTUAL: (name, definition)
+RAW_SOURCE_VIRTUAL_COLUMNS = [
+    ('company_name', "VARCHAR(200) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.dealer.name'))) VIRTUAL"),
+    ('make', "VARCHAR(100) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.vehicle.make'))) VIRTUAL"),
+    ('model', "VARCHAR(100) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.vehicle.model'))) VIRTUAL"),
+    ('price', "VARCHAR(20) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.vehicle.price'))) VIRTUAL"),
+]
+
+# Indexes raw_source must have beyond its first release, added when missing:
+# (name, kind, columns)
+RAW_SOURCE_ADDED_INDEXES = [
+    # get_raw_source_sample: WHERE source = ? ORDER BY created_at DESC LIMIT n
+    ('idx_source_created', 'INDEX', '(source, created_at DESC)'),
+    ('unique_url_hash', 'UNIQUE KEY', '(url_hash)'),
+    # Original indexes; restores them on tables where an earlier bulk load
+    # dropped them and never got to rebuild them
+    ('idx_make_model', 'INDEX', '(make, model)'),
+    ('idx_created', 'INDEX', '(created_at)'),
+]
+
+# Indexes superseded by the ones above, dropped once those exist
+RAW_SOURCE_DROPPED_INDEXES = (
+    'unique_listing',
 )
 
+RAW_SOURCE_INSERT_PREFIX = "INSERT INTO raw_source (source, listing_url, raw_json, raw_sha1) VALUES "
+# Rows whose raw_sha1 already matches are left untouched (no write, same
+# updated_at); raw_sha1 goes last since later assignments see new values
+RAW_SOURCE_UPSERT_SUFFIX = (
+    " ON DUPLICATE KEY UPDATE"
+    " updated_at = IF(raw_sha1 <=> VALUES(raw_sha1), updated_at, NOW()),"
+    " raw_json = IF(raw_sha1 <=> VALUES(raw_sha1), raw_json, VALUES(raw_json)),"
+    " raw_sha1 = VALUES(raw_sha1)"
+)
+
+# Legacy table name fragment -> raw_source source, checked in order by save_rows()
+LEGACY_TABLE_SOURCES = (
+    ('pistonheads', 'piston_heads'),
+    ('aa', 'the_aa'),
+    ('gumtree', 'gumtree'),
+)
+
+# Max rows per multi-row INSERT (4 params each, well under MySQL's 65535 placeholder limit)
+RAW_SOURCE_BATCH_SIZE = 1000
+# Rows per transaction; one commit (redo-log fsync) per this many rows
+RAW_SOURCE_COMMIT_ROWS = 10000
+# Saves at least this large (e.g. a cold-start scrape) go through LOAD DATA
+RAW_SOURCE_BULK_THRESHOLD = 5000
+# LOAD DATA LOCAL refused by the server (local_infile=OFF) or the client
+LOCAL_INFILE_ERRNOS = (1148, 2068, 3948)
+
 # Initialize connection pool with retry logic
 def create_pool(retries=3):
     """Create connection pool with retry logic"""
     for attempt in range(retries):
         try:
             pool = pooling.MySQLConnectionPool(**DB_CFG, **POOL_CFG)
-            print("✅ Database connection pool created successfully")
+            driver = "pure Python" if DB_CFG['use_pure'] else "C extension"
+            print(f"✅ Database connection pool created successfully ({driver} driver)")
             return pool
         except Error as e:
             print(f"❌ Attempt {attempt + 1} failed: {e}")
@@ -460,22 +559,109 @@ def create_pool(retries=3):
                 raise
     return None
 
-# Create the pool
-try:
-    _pool = create_pool()
-    pool = _pool
-except Exception as e:
-    print(f"❌ Failed to create database pool: {e}")
-    pool = None
+# The pool is created on first use so importing this module never blocks on the database
+_pool = None
+_pool_lock = threading.Lock()
+
+# After a failed create_pool(), callers get None straight away for this many
+# seconds instead of each sitting through another round of connect retries
+POOL_RETRY_COOLDOWN = 300
+_pool_failed_at = None
+
+def _get_pool():
+    """Return the shared connection pool, creating it on first call (None if unavailable)"""
+    global _pool, _pool_failed_at
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if _pool_failed_at is not None and time.monotonic() - _pool_failed_at < POOL_RETRY_COOLDOWN:
+                    return None
+                try:
+                    _pool = create_pool()
+                    _pool_failed_at = None
+                except Exception as e:
+                    _pool_failed_at = time.monotonic()
+                    print(f"❌ Failed to create database pool: {e}")
+    return _pool
+
+# Reused stdlib encoder: compact separators and raw UTF-8 instead of \u escapes.
+# default=str is only consulted for non-JSON types, so it costs nothing on
+# the all-string records the scrapers produce.
+_json_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str).encode
+
+def _dumps(rec: dict) -> str:
+    """Serialize a scraped record for the raw_json column (orjson when available)"""
+    if orjson:
+        return orjson.dumps(rec, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return _json_encode(rec)
+
+# One pool connection per thread, held for the life of the process
+_tls = threading.local()
+
+# A cached connection idle for longer than this is pinged (and reconnected
+# if the server dropped it, e.g. after wait_timeout) before it is reused
+CONN_IDLE_PING = 30
+
+def _conn():
+    """Return this thread's cached pool connection, acquiring it on first use"""
+    cn = getattr(_tls, 'cn', None)
+    now = time.monotonic()
+    if cn is not None and now - _tls.used_at > CONN_IDLE_PING:
+        try:
+            cn.ping(reconnect=True, attempts=2, delay=1)
+        except Error as e:
+            log.warning("Cached connection lost (%s), taking a fresh one", e)
+            release_connection()
+            cn = None
+    if cn is None:
+        cn = _tls.cn = _get_pool().get_connection()
+    elif cn.in_transaction:
+        # Drop a read snapshot left open by a previous query
+        cn.rollback()
+    _tls.used_at = now
+    return cn
+
+def release_connection():
+    """Return this thread's cached connection to the pool"""
+    cn = getattr(_tls, 'cn', None)
+    if cn is None:
+        return
+    _tls.cn = None
+    # No is_connected() check: it pings the server; a dead connection just
+    # fails the rollback
+    try:
+        cn.rollback()
+    except Error:
+        pass
+    try:
+        cn.close()
+    except Error:
+        pass
+
+atexit.register(release_connection)
+
+def _close_cursors(*cursors):
+    """Close the given cursors, skipping ones never opened; errors are ignored"""
+    for c in cursors:
+        if c is None:
+            continue
+        try:
+            c.close()
+        except Error:
+            pass
+
+# raw_source DDL only needs to run once per process
+_raw_source_verified = False
+_raw_source_lock = threading.Lock()
 
 def ensure_raw_source_table_exists():
     """Ensure the raw_source table exists"""
-    if not pool:
+    if not _get_pool():
         print("❌ No database connection available")
         return False
         
     try:
-        cn = pool.get_connection()
+        cn = _conn()
         cur = cn.cursor()
         
         # Create raw_source table with all necessary fields
@@ -484,223 +670,552 @@ def ensure_raw_source_table_exists():
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 source VARCHAR(50),
                 listing_url VARCHAR(500),
+                url_hash BINARY(16) GENERATED ALWAYS AS (UNHEX(MD5(CONCAT(source, '|', listing_url)))) STORED,
                 raw_json JSON,
+                raw_sha1 BINARY(20),
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                 
-                -- Extracted fields for quick queries
-                company_name VARCHAR(200) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.dealer.name'))) STORED,
-                make VARCHAR(100) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.vehicle.make'))) STORED,
-                model VARCHAR(100) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.vehicle.model'))) STORED,
-                price VARCHAR(20) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.vehicle.price'))) STORED,
+                -- Extracted fields for quick queries (VIRTUAL: computed on read,
+                -- only materialized inside idx_make_model)
+                company_name VARCHAR(200) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.dealer.name'))) VIRTUAL,
+                make VARCHAR(100) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.vehicle.make'))) VIRTUAL,
+                model VARCHAR(100) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.vehicle.model'))) VIRTUAL,
+                price VARCHAR(20) GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.vehicle.price'))) VIRTUAL,
                 
-                UNIQUE KEY unique_listing (source, listing_url),
+                UNIQUE KEY unique_url_hash (url_hash),
                 INDEX idx_source (source),
                 INDEX idx_created (created_at),
-                INDEX idx_make_model (make, model)
+                INDEX idx_make_model (make, model),
+                INDEX idx_source_created (source, created_at DESC)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
         """)
+        
+        # Add columns introduced after the table was first created
+        # (SHOW COLUMNS/INDEX avoid the slow information_schema views)
+        cur.execute("SHOW COLUMNS FROM raw_source")
+        # name -> Extra ('STORED GENERATED', 'VIRTUAL GENERATED', ...)
+        existing_columns = {row[0]: (row[5] or '').upper() for row in cur.fetchall()}
+        
+        for col_name, col_def in RAW_SOURCE_ADDED_COLUMNS:
+            if col_name not in existing_columns:
+                print(f"📝 Adding missing column '{col_name}' to raw_source table...")
+                cur.execute(f"ALTER TABLE raw_source ADD COLUMN {col_name} {col_def}")
+        
+        cur.execute("SHOW INDEX FROM raw_source")
+        existing_indexes = {row[2] for row in cur.fetchall()}
+        
+        # Tables created before the extracted columns went VIRTUAL still
+        # store them; a column can't switch STORED -> VIRTUAL in place, so
+        # drop and re-add it (one table rebuild) and rebuild idx_make_model
+        stored = [(col_name, col_def) for col_name, col_def in RAW_SOURCE_VIRTUAL_COLUMNS
+                  if existing_columns.get(col_name, '').startswith('STORED')]
+        if stored:
+            print(f"📝 Converting {', '.join(name for name, _ in stored)} to VIRTUAL columns in raw_source table...")
+            changes = ["DROP INDEX idx_make_model"] if 'idx_make_model' in existing_indexes else []
+            changes += [f"DROP COLUMN {col_name}" for col_name, _ in stored]
+            changes += [f"ADD COLUMN {col_name} {col_def}" for col_name, col_def in stored]
+            cur.execute(f"ALTER TABLE raw_source {', '.join(changes)}")
+            # Re-added below with the other missing indexes
+            existing_indexes.discard('idx_make_model')
+        
+        # Add indexes introduced after the table was first created
+        for index_name, index_kind, index_cols in RAW_SOURCE_ADDED_INDEXES:
+            if index_name not in existing_indexes:
+                print(f"📝 Adding missing index '{index_name}' to raw_source table...")
+                cur.execute(f"ALTER TABLE raw_source ADD {index_kind} {index_name} {index_cols}")
+        
+        for index_name in RAW_SOURCE_DROPPED_INDEXES:
+            if index_name in existing_indexes:
+                print(f"📝 Dropping superseded index '{index_name}' from raw_source table...")
+                cur.execute(f"ALTER TABLE raw_source DROP INDEX {index_name}")
+        
         cn.commit()
         print("✅ Raw source table created/verified successfully")
         
         cur.close()
-        cn.close()
         return True
         
     except Error as e:
         print(f"❌ Error ensuring raw_source table exists: {e}")
-        if 'cn' in locals() and cn.is_connected():
-            cn.close()
+        release_connection()
         return False
 
-def save_to_raw_source(records: list[dict], source: str):
-    """Save full raw records to raw_source table"""
+@functools.lru_cache(maxsize=16)
+def _raw_source_insert_sql(n_rows: int) -> str:
+    """Multi-row raw_source upsert for n_rows rows, built once per batch size"""
+    return RAW_SOURCE_INSERT_PREFIX + ", ".join(["(%s, %s, %s, %s)"] * n_rows) + RAW_SOURCE_UPSERT_SUFFIX
+
+def _url_hash(source: str, listing_url: str) -> bytes:
+    """Client-side equivalent of the url_hash generated column"""
+    return hashlib.md5(f"{source}|{listing_url}".encode('utf-8')).digest()
+
+@functools.lru_cache(maxsize=16)
+def _raw_source_hash_sql(n_rows: int) -> str:
+    """Lookup of stored raw_sha1 values for n_rows url_hash keys"""
+    return (
+        "SELECT listing_url, raw_sha1 FROM raw_source WHERE url_hash IN ("
+        + ", ".join(["%s"] * n_rows) + ")"
+    )
+
+# Server max_allowed_packet, read once per process
+_max_packet = None
+
+def _max_allowed_packet(cur) -> int:
+    """Return the server's max_allowed_packet in bytes, queried on first call"""
+    global _max_packet
+    if _max_packet is None:
+        cur.execute("SELECT @@max_allowed_packet")
+        _max_packet = int(cur.fetchone()[0])
+    return _max_packet
+
+# Server local_infile setting, read once per process
+_local_infile = None
+
+def _local_infile_enabled() -> bool:
+    """Return whether the server accepts LOAD DATA LOCAL INFILE, queried on first call"""
+    global _local_infile
+    if _local_infile is None:
+        try:
+            cur = _conn().cursor()
+            cur.execute("SELECT @@local_infile")
+            _local_infile = bool(int(cur.fetchone()[0]))
+            cur.close()
+        except Error as e:
+            print(f"⚠️ Could not read local_infile: {e}")
+            release_connection()
+            return False
+        if not _local_infile:
+            print("⚠️ Server has local_infile=OFF, large saves use batched upserts")
+    return _local_infile
+
+def _raw_source_batches(cur, rows: list):
+    """Yield (start, batch) slices of rows, each within half of max_allowed_packet"""
+    budget = _max_allowed_packet(cur) // 2
+    start = 0
+    size = 0
+    for end, row in enumerate(rows):
+        # url + JSON + hashes + per-row protocol/SQL overhead
+        row_bytes = len(row[1]) + len(row[2]) + 64
+        if end > start and (size + row_bytes > budget or end - start >= RAW_SOURCE_BATCH_SIZE):
+            yield start, rows[start:end]
+            start = end
+            size = 0
+        size += row_bytes
+    if start < len(rows):
+        yield start, rows[start:]
+
+def _latest_by_listing_url(records: list[dict]) -> tuple[dict, int]:
+    """Last record per listing_url (what the upsert would keep) and the count without one"""
+    latest = {}
+    missing = 0
+    for rec in records:
+        listing_url = rec.get('listing_url')
+        if listing_url:
+            latest[listing_url] = rec
+        else:
+            missing += 1
+    return latest, missing
+
+def _raw_source_ready() -> bool:
+    """Run ensure_raw_source_table_exists() on first use only"""
+    global _raw_source_verified
+    if _raw_source_verified:
+        return True
+    with _raw_source_lock:
+        if not _raw_source_verified:
+            _raw_source_verified = ensure_raw_source_table_exists()
+    return _raw_source_verified
+
+def save_to_raw_source(records: list[dict], source: str, progress=None):
+    """Save full raw records to raw_source table (progress(saved, total) is called after each commit)"""
     if not records:
         print("⚠️ No records to save to raw_source")
         return
         
-    if not pool:
+    if not _get_pool():
         print("❌ No database connection available")
         return
         
-    if not ensure_raw_source_table_exists():
+    if not _raw_source_ready():
         print(f"❌ Failed to ensure raw_source table exists")
         return
         
+    # LOAD DATA when the server allows it; a bulk load that didn't commit
+    # falls through to the batched upserts below so no rows are lost
+    if len(records) >= RAW_SOURCE_BULK_THRESHOLD and _local_infile_enabled():
+        if save_to_raw_source_bulk(records, source, progress):
+            return
+        print("  ↩️ Bulk load not committed, saving with batched upserts instead")
+        
     inserted_count = 0
     updated_count = 0
-    error_count = 0
+    unchanged_count = 0
+    
+    # Each listing is upserted once even if the scrape returned it twice
+    latest, error_count = _latest_by_listing_url(records)
+    duplicate_count = len(records) - error_count - len(latest)
+    if error_count:
+        log.warning("Skipping %d records with no listing_url", error_count)
     
+    # Build (source, listing_url, raw_json, raw_sha1) tuples up front so each
+    # record is serialized and hashed exactly once
+    # (hot loop: bind the callables to locals once)
+    rows = []
+    append, dumps, sha1 = rows.append, _dumps, hashlib.sha1
+    for listing_url, rec in latest.items():
+        raw_json = dumps(rec)
+        append((source, listing_url, raw_json, sha1(raw_json.encode('utf-8')).digest()))
+    
+    if rows:
+        log.debug("Sample %s row: %s", source, rows[0][2])
+    
+    cur = lookup_cur = upsert_cur = row_cur = None
     try:
-        cn = pool.get_connection()
+        cn = _conn()
         cur = cn.cursor()
+        # A prepared cursor holds one server-side statement at a time, so
+        # lookups, batch upserts and single-row retries each get their own;
+        # full-size batches then re-execute without re-preparing
+        lookup_cur = cn.cursor(prepared=True)
+        upsert_cur = cn.cursor(prepared=True)
+        row_cur = cn.cursor(prepared=True)
         
-        sql = """
-            INSERT INTO raw_source (source, listing_url, raw_json)
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE 
-                raw_json = VALUES(raw_json), 
-                updated_at = NOW()
-        """
-        
-        for i, rec in enumerate(records, 1):
+        uncommitted = 0
+        for start, batch in _raw_source_batches(cur, rows):
+            
             try:
-                listing_url = rec.get('listing_url', '')
-                if not listing_url:
-                    print(f"  ⚠️ Skipping record {i} - no listing_url")
-                    error_count += 1
-                    continue
-                    
-                raw_json = json.dumps(rec, default=str)
-                
-                # Debug print for first few rows
-                if i <= 3:
-                    vehicle = rec.get('vehicle', {})
-                    dealer = rec.get('dealer', {})
-                    print(f"\n📝 Row {i} data:")
-                    print(f"   URL: {listing_url}")
-                    print(f"   Dealer: {dealer.get('name', 'N/A')}")
-                    print(f"   Vehicle: {vehicle.get('make', 'N/A')} {vehicle.get('model', 'N/A')}")
-                    print(f"   Price: {vehicle.get('price', 'N/A')}")
-                
-                cur.execute(sql, (source, listing_url, raw_json))
-                
-                if cur.rowcount == 1:
-                    inserted_count += 1
-                elif cur.rowcount == 2:  # MySQL returns 2 for updates
-                    updated_count += 1
+                # Fetch stored hashes so unchanged listings are neither sent
+                # nor rewritten (re-scrapes are mostly unchanged)
+                lookup_cur.execute(_raw_source_hash_sql(len(batch)), [_url_hash(source, row[1]) for row in batch])
+                stored = {url: bytes(sha1) if sha1 is not None else None for url, sha1 in lookup_cur.fetchall()}
+            except Error as e:
+                error_count += len(batch)
+                print(f"  ⚠️ Error on rows {start + 1}-{start + len(batch)}: {e}")
+                continue
+            
+            changed = [row for row in batch if stored.get(row[1]) != row[3]]
+            unchanged_count += len(batch) - len(changed)
+            
+            if changed:
+                try:
+                    # One multi-row INSERT per batch instead of one round-trip per row
+                    upsert_cur.execute(_raw_source_insert_sql(len(changed)), list(chain.from_iterable(changed)))
+                    saved = changed
                     
-                # Commit every 50 rows
-                if i % 50 == 0:
-                    cn.commit()
-                    print(f"  💾 Saved {i}/{len(records)} raw records...")
+                except Error as e:
+                    # A failed statement is rolled back on its own; earlier
+                    # batches in the transaction are kept. Retry this batch
+                    # row by row so one bad row doesn't drop the rest.
+                    print(f"  ⚠️ Error on rows {start + 1}-{start + len(batch)}: {e} - retrying row by row")
+                    saved = []
+                    failed = []
+                    for row in changed:
+                        try:
+                            row_cur.execute(_raw_source_insert_sql(1), row)
+                            saved.append(row)
+                        except Error as row_error:
+                            failed.append((row[1], row_error))
                     
-            except Error as e:
-                error_count += 1
-                print(f"  ⚠️ Error on row {i}: {e}")
-                # Continue with next row
+                    # One summary per batch rather than a line per bad row
+                    if failed:
+                        error_count += len(failed)
+                        print(f"  ⚠️ {len(failed)} insert errors in rows {start + 1}-{start + len(batch)}")
+                        log.debug("First failed row %s: %s", *failed[0])
                 
+                batch_updated = sum(1 for row in saved if row[1] in stored)
+                inserted_count += len(saved) - batch_updated
+                updated_count += batch_updated
+            
+            uncommitted += len(batch)
+            if uncommitted >= RAW_SOURCE_COMMIT_ROWS:
+                cn.commit()
+                uncommitted = 0
+                if progress:
+                    progress(start + len(batch), len(rows))
+        
         # Final commit
         cn.commit()
-        
-        # Get total count for this source
-        cur.execute("SELECT COUNT(*) FROM raw_source WHERE source = %s", (source,))
-        source_count = cur.fetchone()[0]
-        
-        # Get total count
-        cur.execute("SELECT COUNT(*) FROM raw_source")
-        total_count = cur.fetchone()[0]
+        if progress:
+            progress(len(rows), len(rows))
         
         print(f"\n✅ Database operation complete for {source}:")
         print(f"   - New records inserted: {inserted_count}")
         print(f"   - Records updated: {updated_count}")
+        print(f"   - Unchanged (skipped): {unchanged_count}")
+        print(f"   - Duplicate URLs merged: {duplicate_count}")
         print(f"   - Errors: {error_count}")
-        print(f"   - Total {source} records: {source_count}")
-        print(f"   - Total records in raw_source table: {total_count}")
-        
-        cur.close()
-        cn.close()
         
     except Error as e:
         print(f"❌ Database save failed: {e}")
-        if 'cn' in locals() and cn.is_connected():
-            cn.rollback()
-            cn.close()
+        release_connection()
+    finally:
+        # Prepared cursors hold server-side statements; close them on every path
+        _close_cursors(lookup_cur, upsert_cur, row_cur, cur)
 
-def get_stats_by_source() -> dict:
-    """Get statistics grouped by source from raw_source table"""
-    if not pool:
-        return {}
+def save_to_raw_source_bulk(records: list[dict], source: str, progress=None) -> bool:
+    """Bulk-load raw records via LOAD DATA LOCAL INFILE into a staging table, then upsert
+    (progress(saved, total) is called once, after the single commit; returns
+    whether that commit happened)"""
+    global _local_infile
+    if not records:
+        print("⚠️ No records to save to raw_source")
+        return True
+        
+    if not _get_pool():
+        print("❌ No database connection available")
+        return False
         
+    if not _raw_source_ready():
+        print(f"❌ Failed to ensure raw_source table exists")
+        return False
+        
+    latest, skipped_count = _latest_by_listing_url(records)
+    duplicate_count = len(records) - skipped_count - len(latest)
+    loaded_count = 0
+    committed = False
+    
+    # Write a TSV with every field hex-encoded so tabs, newlines and
+    # backslashes in the JSON never need LOAD DATA escaping
+    fd, infile = tempfile.mkstemp(prefix="raw_source_", suffix=".tsv")
+    cur = None
     try:
-        cn = pool.get_connection()
+        with os.fdopen(fd, 'w', encoding='ascii', newline='') as f:
+            source_hex = source.encode('utf-8').hex()
+            for listing_url, rec in latest.items():
+                raw_json = _dumps(rec).encode('utf-8')
+                f.write(f"{source_hex}\t{listing_url.encode('utf-8').hex()}\t{raw_json.hex()}\t{hashlib.sha1(raw_json).hexdigest()}\n")
+                loaded_count += 1
+        
+        cn = _conn()
         cur = cn.cursor()
         
-        # Get count by source from raw_source table
         cur.execute("""
-            SELECT source, COUNT(*) as count 
-            FROM raw_source 
-            WHERE source IS NOT NULL 
-            GROUP BY source
+            CREATE TEMPORARY TABLE IF NOT EXISTS raw_source_stage (
+                source VARCHAR(50),
+                listing_url VARCHAR(500),
+                raw_json JSON,
+                raw_sha1 BINARY(20)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
         """)
-        source_counts = dict(cur.fetchall())
+        cur.execute("TRUNCATE TABLE raw_source_stage")
         
-        # Get total count from raw_source
-        cur.execute("SELECT COUNT(*) FROM raw_source")
-        total = cur.fetchone()[0]
+        cur.execute("""
+            LOAD DATA LOCAL INFILE %s
+            INTO TABLE raw_source_stage
+            FIELDS TERMINATED BY '\\t'
+            LINES TERMINATED BY '\\n'
+            (@source, @listing_url, @raw_json, @raw_sha1)
+            SET source = CONVERT(UNHEX(@source) USING utf8mb4),
+                listing_url = CONVERT(UNHEX(@listing_url) USING utf8mb4),
+                raw_json = CONVERT(UNHEX(@raw_json) USING utf8mb4),
+                raw_sha1 = UNHEX(@raw_sha1)
+        """, (infile,))
+        print(f"  📥 Loaded {cur.rowcount} rows into raw_source_stage")
         
-        # Get recent records from raw_source
+        # Count genuinely new listings so the upsert's affected rows can be split
         cur.execute("""
-            SELECT source, COUNT(*) as count 
-            FROM raw_source 
-            WHERE created_at >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
-            AND source IS NOT NULL
-            GROUP BY source
+            SELECT COUNT(*)
+            FROM raw_source_stage s
+            LEFT JOIN raw_source r ON r.url_hash = UNHEX(MD5(CONCAT(s.source, '|', s.listing_url)))
+            WHERE r.id IS NULL
         """)
-        recent_counts = dict(cur.fetchall())
+        inserted_count = cur.fetchone()[0]
+        
+        # Unchanged rows (same raw_sha1) keep their data and updated_at;
+        # raw_sha1 is assigned last because later assignments see new values
+        cur.execute("""
+            INSERT INTO raw_source (source, listing_url, raw_json, raw_sha1)
+            SELECT s.source, s.listing_url, s.raw_json, s.raw_sha1 FROM raw_source_stage s
+            ON DUPLICATE KEY UPDATE
+                updated_at = IF(raw_source.raw_sha1 <=> s.raw_sha1, raw_source.updated_at, NOW()),
+                raw_json = IF(raw_source.raw_sha1 <=> s.raw_sha1, raw_source.raw_json, s.raw_json),
+                raw_sha1 = s.raw_sha1
+        """)
+        
+        # MySQL reports 1 affected row per insert, 2 per update and 0 when unchanged
+        updated_count = max(cur.rowcount - inserted_count, 0) // 2
+        unchanged_count = max(loaded_count - inserted_count - updated_count, 0)
+        
+        cn.commit()
+        committed = True
+        if progress:
+            progress(loaded_count, loaded_count)
+        
+        cur.execute("DROP TEMPORARY TABLE IF EXISTS raw_source_stage")
+        
+        print(f"\n✅ Bulk load complete for {source}:")
+        print(f"   - New records inserted: {inserted_count}")
+        print(f"   - Records updated: {updated_count}")
+        print(f"   - Unchanged: {unchanged_count}")
+        print(f"   - Duplicate URLs merged: {duplicate_count}")
+        print(f"   - Skipped (no listing_url): {skipped_count}")
+        
+    except Error as e:
+        print(f"❌ Bulk load failed: {e}")
+        if e.errno in LOCAL_INFILE_ERRNOS:
+            # Refused by configuration: skip LOAD DATA for the rest of the run
+            _local_infile = False
+        release_connection()
+    finally:
+        _close_cursors(cur)
+        os.unlink(infile)
+    return committed
+
+def get_existing_listing_urls(source: str, listing_urls: list[str]) -> set:
+    """Return the listing_urls already stored in raw_source for a source"""
+    if not listing_urls or not _get_pool() or not _raw_source_ready():
+        return set()
+        
+    try:
+        cn = _conn()
+        cur = cn.cursor()
+        
+        # Probe the url_hash unique key, one round-trip for the whole list
+        cur.execute(_raw_source_hash_sql(len(listing_urls)), [_url_hash(source, url) for url in listing_urls])
+        existing = {row[0] for row in cur.fetchall()}
         
         cur.close()
-        cn.close()
         
-        return {
-            'total': total,
-            'by_source': source_counts,
-            'last_24h': recent_counts
-        }
+        return existing
+        
+    except Error as e:
+        print(f"❌ Error checking existing listings: {e}")
+        release_connection()
+        return set()
+
+# Per-source totals, last-24h counts and the grand total (ROLLUP row,
+# source = NULL) in a single pass over raw_source
+RAW_SOURCE_STATS_SQL = """
+    SELECT source,
+           COUNT(*) AS count,
+           SUM(created_at >= DATE_SUB(NOW(), INTERVAL 24 HOUR)) AS recent
+    FROM raw_source
+    WHERE source IS NOT NULL
+    GROUP BY source WITH ROLLUP
+"""
+
+RAW_SOURCE_SAMPLE_SQL = """
+    SELECT listing_url, company_name, make, model, price, created_at
+    FROM raw_source
+    WHERE source = %s
+    ORDER BY created_at DESC
+    LIMIT %s
+"""
+
+def _stats_from_rows(rows) -> dict:
+    """Build the get_stats_by_source() dict from RAW_SOURCE_STATS_SQL rows"""
+    total = 0
+    source_counts = {}
+    recent_counts = {}
+    for source, count, recent in rows:
+        if source is None:
+            total = count
+            continue
+        source_counts[source] = count
+        if recent:
+            recent_counts[source] = int(recent)
+    
+    return {
+        'total': total,
+        'by_source': source_counts,
+        'last_24h': recent_counts
+    }
+
+def get_stats_by_source() -> dict:
+    """Get statistics grouped by source from raw_source table"""
+    if not _get_pool():
+        return {}
+        
+    try:
+        cn = _conn()
+        cur = cn.cursor()
+        
+        cur.execute(RAW_SOURCE_STATS_SQL)
+        stats = _stats_from_rows(cur.fetchall())
+        
+        cur.close()
+        
+        return stats
         
     except Error as e:
         print(f"❌ Error getting stats: {e}")
+        release_connection()
         return {}
 
 def get_raw_source_sample(source: str, limit: int = 5) -> list:
     """Get sample records from raw_source for a specific source"""
-    if not pool:
+    if not _get_pool():
         return []
         
     try:
-        cn = pool.get_connection()
+        cn = _conn()
         cur = cn.cursor()
         
-        cur.execute("""
-            SELECT listing_url, company_name, make, model, price, created_at
-            FROM raw_source
-            WHERE source = %s
-            ORDER BY created_at DESC
-            LIMIT %s
-        """, (source, limit))
+        cur.execute(RAW_SOURCE_SAMPLE_SQL, (source, limit))
         
         results = cur.fetchall()
         cur.close()
-        cn.close()
         
         return results
         
     except Error as e:
         print(f"❌ Error getting sample: {e}")
+        release_connection()
         return []
 
+def get_dashboard_snapshot(source: str, limit: int = 5) -> dict:
+    """Stats and a sample for one source in a single round-trip"""
+    if not _get_pool():
+        return {}
+        
+    try:
+        cn = _conn()
+        cur = cn.cursor()
+        
+        # Both statements go out in one multi-statement query; the result
+        # sets come back in order
+        cur.execute(RAW_SOURCE_STATS_SQL + ";" + RAW_SOURCE_SAMPLE_SQL, (source, limit))
+        stats = _stats_from_rows(cur.fetchall())
+        cur.nextset()
+        sample = cur.fetchall()
+        
+        cur.close()
+        
+        return {
+            'stats': stats,
+            'sample': sample
+        }
+        
+    except Error as e:
+        print(f"❌ Error getting dashboard snapshot: {e}")
+        release_connection()
+        return {}
+
 # DEPRECATED: Old functions kept for backward compatibility
 def ensure_leads_table_exists():
     """DEPRECATED: Use raw_source table instead"""
-    print("⚠️ WARNING: ensure_leads_table_exists() is deprecated. Use ensure_raw_source_table_exists() instead.")
-    return ensure_raw_source_table_exists()
+    warnings.warn("ensure_leads_table_exists() is deprecated, use ensure_raw_source_table_exists()",
+                  DeprecationWarning, stacklevel=2)
+    return _raw_source_ready()
 
 def save_to_leads(rows: list[dict], source: str):
     """DEPRECATED: Use save_to_raw_source() instead"""
-    print("⚠️ WARNING: save_to_leads() is deprecated. Redirecting to save_to_raw_source()...")
+    warnings.warn("save_to_leads() is deprecated, use save_to_raw_source()",
+                  DeprecationWarning, stacklevel=2)
     save_to_raw_source(rows, source)
 
+@functools.lru_cache(maxsize=None)
+def _legacy_table_source(table: str) -> str:
+    """Determine raw_source source from a legacy table name"""
+    table = table.lower()
+    for fragment, source in LEGACY_TABLE_SOURCES:
+        if fragment in table:
+            return source
+    return 'cazoo'
+
 def save_rows(table: str, rows: list[dict]):
     """DEPRECATED: Use save_to_raw_source() instead"""
-    print("⚠️ WARNING: save_rows() is deprecated. Redirecting to save_to_raw_source()...")
-    # Determine source from table name
-    if 'pistonheads' in table.lower():
-        source = 'piston_heads'
-    elif 'aa' in table.lower():
-        source = 'the_aa'
-    elif 'gumtree' in table.lower():
-        source = 'gumtree'
-    else:
-        source = 'cazoo'
-    
-    save_to_raw_source(rows, source)
\ No newline at end of file
+    warnings.warn("save_rows() is deprecated, use save_to_raw_source()",
+                  DeprecationWarning, stacklevel=2)
+    save_to_raw_source(rows, _legacy_table_source(table))
\ No newline at end of file
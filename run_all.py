@@ -1,91 +1,193 @@
 # run_all.py — Enhanced orchestrator with page-based progress tracking
 import asyncio
+import contextlib
+import copy
 import json
-from datetime import datetime
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from db_helper import save_to_raw_source, get_stats_by_source
+from crawl4ai import AsyncWebCrawler
+from db_helper import DB_WORKER_THREADS, get_stats_by_source
 from scrapers.pistonheads_scraper import run_pistonheads
 from scrapers.aa_scraper import run_aa
 from scrapers.cazoo_scraper import run_cazoo
 from scrapers.gumtree_scraper import run_gumtree
 import csv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+log = logging.getLogger("orchestrator")
+
+# Concurrent page fetches allowed per site in the shared browser
+PER_HOST_CONCURRENCY = 8
+
+# Attempts per scraper before its failure is reported; waits 1s, 2s, ...
+# (plus jitter) between them
+SCRAPER_ATTEMPTS = 3
+
 # Progress file to track scraping state
 PROGRESS_FILE = "scraping_progress.json"
 
+# Progress as last read from / written to PROGRESS_FILE, so an unchanged
+# state is not rewritten
+_saved_progress = None
+
+# Scrapers run by main(), keyed by their progress/config name.
+# "limit_arg" is the scraper's keyword for the listing cap in config;
+# "shares_crawler" scrapers take the run's browser as `crawler=` and a
+# per-host fetch limit as `sem=`.
+# Every scraper saves to raw_source itself as it goes (in worker threads):
+# PistonHeads returns a count, the others return their scraped rows.
+SCRAPERS = {
+    "pistonheads": {
+        "label": "PistonHeads",
+        "icon": "🏁",
+        "run": run_pistonheads,
+        "limit_arg": "max_per_page",
+        "shares_crawler": True,
+    },
+    "aa": {
+        "label": "AA Cars",
+        "icon": "🚗",
+        "run": run_aa,
+        "limit_arg": "batch_size",
+        "shares_crawler": True,
+    },
+    "cazoo": {
+        "label": "Cazoo",
+        "icon": "🚗",
+        "run": run_cazoo,
+        "limit_arg": "batch_size",
+        "csv_file": "cazoo_scraped_data.csv",
+    },
+    "gumtree": {
+        "label": "Gumtree",
+        "icon": "🚗",
+        "run": run_gumtree,
+        "limit_arg": "batch_size",
+    },
+}
+
 # ────────────────────────────────────────────────────────────
 # Progress tracking functions
 # ────────────────────────────────────────────────────────────
+def _json_loads(data: bytes):
+    """Parse JSON bytes (orjson when available)"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _json_dumps(obj) -> bytes:
+    """Indented JSON as bytes (orjson when available)"""
+    if orjson:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, default=str).encode()
+
 def load_progress() -> dict:
     """Load progress from file"""
+    global _saved_progress
     if Path(PROGRESS_FILE).exists():
         try:
-            with open(PROGRESS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            pass
+            with open(PROGRESS_FILE, 'rb') as f:
+                progress = _json_loads(f.read())
+            _saved_progress = copy.deepcopy(progress)
+            # Scrapers added since the file was written start from scratch
+            for name, fresh in default_progress().items():
+                progress.setdefault(name, fresh)
+            return progress
+        except (OSError, ValueError) as e:
+            # ValueError covers json's and orjson's JSONDecodeError
+            print(f"⚠️ Could not read {PROGRESS_FILE}, starting from defaults: {e}")
     
-    # Default progress
+    return default_progress()
+
+def default_progress() -> dict:
+    """Fresh progress for every scraper"""
     return {
-        "pistonheads": {
-            "last_page": 0,
-            "total_pages_scraped": 0,
-            "total_listings": 0,
-            "last_run": None
-        },
-        "aa": {
-            "last_page": 0,
-            "total_pages_scraped": 0,
-            "total_listings": 0,
-            "last_run": None
-        },
-        "cazoo": {
-            "last_page": 0,
-            "total_pages_scraped": 0,
-            "total_listings": 0,
-            "last_run": None
-        },
-        "gumtree": {
+        name: {
             "last_page": 0,
             "total_pages_scraped": 0,
             "total_listings": 0,
             "last_run": None
         }
+        for name in SCRAPERS
     }
 
 def save_progress(progress: dict):
-    """Save progress to file"""
-    with open(PROGRESS_FILE, 'w') as f:
-        json.dump(progress, f, indent=2)
+    """Save progress to file (atomically, and only if it changed)"""
+    global _saved_progress
+    if progress == _saved_progress:
+        return
+    
+    # Write a temp file and swap it in so an interrupted write never
+    # leaves a truncated progress file behind
+    tmp_file = PROGRESS_FILE + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(_json_dumps(progress))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, PROGRESS_FILE)
+    _saved_progress = copy.deepcopy(progress)
 
 # ────────────────────────────────────────────────────────────
-# Helper: flatten nested {"vehicle":{}, "dealer":{}} → single dict
+# Stage timing
 # ────────────────────────────────────────────────────────────
-def flatten(rec: dict) -> dict:
-    """Flatten nested vehicle and dealer data into single dict"""
-    v = rec.get("vehicle", {})
-    d = rec.get("dealer", {})
+@contextlib.contextmanager
+def stage(name: str):
+    """Log how long the wrapped block took"""
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        log.info("⏱️ stage %s took %.2fs", name, time.monotonic() - t0)
 
-    flat = {
-        "listing_url": rec.get("listing_url"),
-        "title": v.get("title"),
-        "make": v.get("make"),
-        "model": v.get("model"),
-        "variant": v.get("variant"),
-        "year": v.get("year"),
-        "price": v.get("price"),
-        "mileage": v.get("mileage"),
-        "fuel_type": v.get("fuel_type"),
-        "body_type": v.get("body_type"),
-        "gearbox": v.get("gearbox"),
-        "dealer_name": d.get("name"),
-        "dealer_phone": d.get("phone"),
-        "dealer_location": d.get("location"),
-        "dealer_city": d.get("city"),
-    }
-    
-    # Remove None values
-    return {k: v for k, v in flat.items() if v not in (None, "", {})}
+# ────────────────────────────────────────────────────────────
+# CSV export
+# ────────────────────────────────────────────────────────────
+# Fixed column order so appended runs line up under one header
+CSV_FIELDS = [
+    "title", "make", "model", "variant", "year", "price", "mileage",
+    "fuel_type", "body_type", "gearbox",
+    "name", "phone", "location", "city", "address", "email", "website",
+    "contact_form_url", "note",
+    "listing_url",
+]
+
+def _csv_row(rec: dict) -> list:
+    """One CSV line in CSV_FIELDS order (dealer values win over vehicle ones, as in a merge)"""
+    vehicle = rec.get('vehicle', {})
+    dealer = rec.get('dealer', {})
+    return [
+        rec.get('listing_url') if key == 'listing_url' else dealer.get(key, vehicle.get(key))
+        for key in CSV_FIELDS
+    ]
+
+def save_to_csv(rows, filename):
+    """Append scraped rows to a CSV file (header only when the file is new)"""
+    if not rows:
+        print("No data to save to CSV.")
+        return
+    # One open and a 1 MiB buffer for the whole batch
+    with open(filename, 'a', newline='', encoding='utf-8', buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        # Append mode starts at the end: position 0 means a new or empty file
+        if f.tell() == 0:
+            writer.writerow(CSV_FIELDS)
+        # Write each record straight into column order, no intermediate list
+        writer.writerows(_csv_row(r) for r in rows)
+    log.info("✅ Saved %d rows to %s", len(rows), filename)
 
 # ────────────────────────────────────────────────────────────
 # Main orchestrator function
@@ -95,204 +197,134 @@ async def main():
     print("🚗 AUTO TRADER SCRAPER ORCHESTRATOR")
     print("="*60)
     
+    # Every to_thread call may save or look up listings, and each worker
+    # thread keeps its own pooled connection; cap the executor so the
+    # workers plus this thread (stats) never outnumber the pool
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=DB_WORKER_THREADS))
+    
     # Load progress
     progress = load_progress()
     
+    # One UTC timestamp for the whole run, shared by every scraper it updates
+    run_ts = datetime.now(timezone.utc).isoformat()
+    
     # Configuration
     config = {
         "pistonheads": {
             "enabled": False,
             "pages_per_run": 3,  # Number of pages to scrape per run
-            "max_listings_per_page": 50,  # Max listings per page
+            "max_listings": 50,  # Max listings per page
         },
         "aa": {
             "enabled": True,
             "pages_per_run": 3,  # Number of pages to scrape per run
-            "max_listings_per_batch": 100,  # Max listings to process
+            "max_listings": 100,  # Max listings to process
         },
         "cazoo": {
             "enabled": False,
             "pages_per_run": 3,  # Number of pages to scrape per run
-            "max_listings_per_batch": 100,  # Max listings to process
+            "max_listings": 100,  # Max listings to process
         },
         "gumtree": {
             "enabled": False,
             "pages_per_run": 3,
-            "max_listings_per_batch": 100
+            "max_listings": 100
         }
     }
     
     # Show current progress
     print("\n📊 CURRENT PROGRESS:")
-    print(f"   - PistonHeads: Last page {progress['pistonheads']['last_page']}, "
-          f"Total scraped: {progress['pistonheads']['total_listings']}")
-    print(f"   - AA Cars: Last page {progress['aa']['last_page']}, "
-          f"Total scraped: {progress['aa']['total_listings']}")
-    print(f"   - Cazoo: Last page {progress['cazoo']['last_page']}, "
-          f"Total scraped: {progress['cazoo']['total_listings']}")
-    print(f"   - Gumtree: Last page {progress['gumtree']['last_page']}, "
-          f"Total scraped: {progress['gumtree']['total_listings']}")
+    for name, scraper in SCRAPERS.items():
+        print(f"   - {scraper['label']}: Last page {progress[name]['last_page']}, "
+              f"Total scraped: {progress[name]['total_listings']}")
     
-    # ─── PISTONHEADS SCRAPER ───
-    if config["pistonheads"]["enabled"]:
+    async def run_scraper(name: str, crawler):
+        """Run one scraper; returns its listing count"""
+        scraper = SCRAPERS[name]
         print(f"\n{'─'*50}")
-        print("🏁 PISTONHEADS SCRAPER")
+        print(f"{scraper['icon']} {scraper['label'].upper()} SCRAPER")
         print(f"{'─'*50}")
         
         # Calculate start page
-        start_page = progress["pistonheads"]["last_page"] + 1
-        end_page = start_page + config["pistonheads"]["pages_per_run"] - 1
+        start_page = progress[name]["last_page"] + 1
+        end_page = start_page + config[name]["pages_per_run"] - 1
         
-        print(f"📄 Scraping pages {start_page} to {end_page}")
+        log.info("%s: scraping pages %d to %d", scraper["label"], start_page, end_page)
         
-        try:
-            ph_rows = await run_pistonheads(
-                batch_pages=config["pistonheads"]["pages_per_run"],
-                start_page=start_page,
-                max_per_page=config["pistonheads"]["max_listings_per_page"]
-            )
-            
-            if ph_rows:
-                # Flatten and save to leads table
-                ph_flat = [flatten(r) for r in ph_rows if r]
-                save_to_raw_source(ph_rows, "piston_heads")
-                
-                # Update progress
-                progress["pistonheads"]["last_page"] = end_page
-                progress["pistonheads"]["total_pages_scraped"] += config["pistonheads"]["pages_per_run"]
-                progress["pistonheads"]["total_listings"] += len(ph_flat)
-                progress["pistonheads"]["last_run"] = datetime.now().isoformat()
-                
-                print(f"✅ PistonHeads: {len(ph_flat)} new listings saved")
-                print(f"📄 Next run will start from page {progress['pistonheads']['last_page'] + 1}")
-            else:
-                print("⚠️ No PistonHeads listings found")
-                
-        except Exception as e:
-            print(f"❌ PistonHeads error: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    # ─── AA SCRAPER ───
-    if config["aa"]["enabled"]:
-        print(f"\n{'─'*50}")
-        print("🚗 AA CARS SCRAPER")
-        print(f"{'─'*50}")
+        kwargs = {scraper["limit_arg"]: config[name]["max_listings"]}
+        if scraper.get("shares_crawler"):
+            # Each scraper targets its own host, so one semaphore per
+            # scraper bounds the tabs open against that site
+            kwargs["crawler"] = crawler
+            kwargs["sem"] = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+        for attempt in range(SCRAPER_ATTEMPTS):
+            try:
+                with stage(f"{name}_scrape"):
+                    result = await scraper["run"](
+                        batch_pages=config[name]["pages_per_run"],
+                        start_page=start_page,
+                        **kwargs
+                    )
+                break
+            except Exception as e:
+                if attempt == SCRAPER_ATTEMPTS - 1:
+                    raise
+                # PistonHeads skips listings it already saved; the other
+                # scrapers fetch their pages again from start_page
+                delay = 2 ** attempt + random.random()
+                log.warning("⚠️ %s attempt %d failed (%s), retrying in %.1fs",
+                            scraper["label"], attempt + 1, e, delay)
+                await asyncio.sleep(delay)
         
-        # Calculate start page
-        start_page = progress["aa"]["last_page"] + 1
-        end_page = start_page + config["aa"]["pages_per_run"] - 1
+        # PistonHeads returns its count directly
+        if isinstance(result, int):
+            return result
+        if not result:
+            return 0
         
-        print(f"📄 Scraping pages {start_page} to {end_page}")
-        
-        try:
-            aa_rows = await run_aa(
-                batch_size=config["aa"]["max_listings_per_batch"],
-                batch_pages=config["aa"]["pages_per_run"],
-                start_page=start_page
-            )
-            
-            if aa_rows:
-                # Flatten and save to leads table
-                aa_flat = [flatten(r) for r in aa_rows if r]
-                save_to_raw_source(aa_rows, "the_aa")
-                
-                # Update progress
-                progress["aa"]["last_page"] = end_page
-                progress["aa"]["total_pages_scraped"] += config["aa"]["pages_per_run"]
-                progress["aa"]["total_listings"] += len(aa_flat)
-                progress["aa"]["last_run"] = datetime.now().isoformat()
-                
-                print(f"✅ AA Cars: {len(aa_flat)} new listings saved")
-                print(f"📄 Next run will start from page {progress['aa']['last_page'] + 1}")
-            else:
-                print("⚠️ No AA listings found")
-                
-        except Exception as e:
-            print(f"❌ AA Cars error: {e}")
-            import traceback
-            traceback.print_exc()
+        if scraper.get("csv_file"):
+            # File write in a worker thread so the other scrapers keep running
+            with stage(f"{name}_csv"):
+                await asyncio.to_thread(save_to_csv, result, scraper["csv_file"])
+        return len(result)
     
-    # ─── CAZOO SCRAPER ───
-    if config["cazoo"]["enabled"]:
-        print(f"\n{'─'*50}")
-        print("🚗 CAZOO SCRAPER")
-        print(f"{'─'*50}")
-        
-        # Calculate start page
-        start_page = progress["cazoo"]["last_page"] + 1
-        end_page = start_page + config["cazoo"]["pages_per_run"] - 1
-        
-        print(f"📄 Scraping pages {start_page} to {end_page}")
-        
-        try:
-            cz_rows = await run_cazoo(
-                batch_size=config["cazoo"]["max_listings_per_batch"],
-                batch_pages=config["cazoo"]["pages_per_run"],
-                start_page=start_page
-            )
-            
-            if cz_rows:
-                # Flatten and save to leads table
-                cz_flat = [flatten(r) for r in cz_rows if r]
-                save_to_raw_source(cz_rows, "cazoo")
-                
-                # Update progress
-                progress["cazoo"]["last_page"] = end_page
-                progress["cazoo"]["total_pages_scraped"] += config["cazoo"]["pages_per_run"]
-                progress["cazoo"]["total_listings"] += len(cz_flat)
-                progress["cazoo"]["last_run"] = datetime.now().isoformat()
-                
-                print(f"✅ Cazoo: {len(cz_flat)} new listings saved")
-                print(f"📄 Next run will start from page {progress['cazoo']['last_page'] + 1}")
-                
-                save_to_csv(cz_rows, "cazoo_scraped_data.csv")
-            else:
-                print("⚠️ No Cazoo listings found")
-                
-        except Exception as e:
-            print(f"❌ Cazoo error: {e}")
-            import traceback
-            traceback.print_exc()
+    # Run the enabled scrapers concurrently: different sites, no shared
+    # state. A failure in one is returned, not raised, so the rest still
+    # finish and get their progress recorded.
+    enabled = [name for name in SCRAPERS if config[name]["enabled"]]
     
-    # ─── GUMTREE SCRAPER ───
-    if config["gumtree"]["enabled"]:
-        print(f"\n{'─'*50}")
-        print("🚗 GUMTREE SCRAPER")
-        print(f"{'─'*50}")
-        
-        # Calculate start page
-        start_page = progress["gumtree"]["last_page"] + 1
-        end_page = start_page + config["gumtree"]["pages_per_run"] - 1
-        
-        print(f"📄 Scraping pages {start_page} to {end_page}")
-        
-        try:
-            gumtree_rows = await run_gumtree(
-                batch_pages=config["gumtree"]["pages_per_run"],
-                start_page=start_page,
-                batch_size=config["gumtree"]["max_listings_per_batch"]
-            )
+    # One browser for every scraper that can share it, instead of a
+    # Chromium launch per scraper; not started if none of them is enabled
+    if any(SCRAPERS[name].get("shares_crawler") for name in enabled):
+        browser = AsyncWebCrawler(
+            verbose=False,
+            headless=True,
+            browser_type="chromium",
+            page_timeout=60000,
+            remove_overlay_elements=True
+        )
+    else:
+        browser = contextlib.nullcontext()
+    
+    async with browser as crawler:
+        results = await asyncio.gather(*(run_scraper(name, crawler) for name in enabled), return_exceptions=True)
+    
+    # Update progress in one place, after every scraper is done
+    for name, result in zip(enabled, results):
+        label = SCRAPERS[name]["label"]
+        if isinstance(result, Exception):
+            log.error("❌ %s failed: %s", label, result, exc_info=result)
+        elif result:
+            count = result
+            progress[name]["last_page"] += config[name]["pages_per_run"]
+            progress[name]["total_pages_scraped"] += config[name]["pages_per_run"]
+            progress[name]["total_listings"] += count
+            progress[name]["last_run"] = run_ts
             
-            if gumtree_rows:
-                # Flatten and save to leads table
-                gumtree_flat = [flatten(r) for r in gumtree_rows if r]
-                save_to_raw_source(gumtree_rows, "gumtree")
-                
-                # Update progress
-                progress["gumtree"]["last_page"] = end_page
-                progress["gumtree"]["total_pages_scraped"] += config["gumtree"]["pages_per_run"]
-                progress["gumtree"]["total_listings"] += len(gumtree_flat)
-                progress["gumtree"]["last_run"] = datetime.now().isoformat()
-                
-                print(f"✅ Gumtree: {len(gumtree_flat)} new listings saved")
-                print(f"📄 Next run will start from page {progress['gumtree']['last_page'] + 1}")
-            else:
-                print("⚠️ No Gumtree listings found")
-        except Exception as e:
-            print(f"❌ Gumtree error: {e}")
-            import traceback
-            traceback.print_exc()
+            log.info("✅ %s: %d listings scraped", label, count)
+            log.info("📄 %s: next run will start from page %d", label, progress[name]['last_page'] + 1)
+        else:
+            log.warning("⚠️ No %s listings found", label)
     
     # Save progress
     save_progress(progress)
@@ -320,10 +352,8 @@ async def main():
     
     print(f"\n📝 Progress saved to: {PROGRESS_FILE}")
     print("\n🔄 NEXT RUN WILL START FROM:")
-    print(f"   - PistonHeads: Page {progress['pistonheads']['last_page'] + 1}")
-    print(f"   - AA Cars: Page {progress['aa']['last_page'] + 1}")
-    print(f"   - Cazoo: Page {progress['cazoo']['last_page'] + 1}")
-    print(f"   - Gumtree: Page {progress['gumtree']['last_page'] + 1}")
+    for name, scraper in SCRAPERS.items():
+        print(f"   - {scraper['label']}: Page {progress[name]['last_page'] + 1}")
     print(f"{'='*60}")
 
 # ────────────────────────────────────────────────────────────
@@ -332,37 +362,14 @@ async def main():
 if __name__ == "__main__":
     import sys
     
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    
     # Check for command line arguments
     if len(sys.argv) > 1:
         if sys.argv[1] == "--reset":
             # Reset progress
             print("🔄 Resetting progress...")
-            save_progress({
-                "pistonheads": {
-                    "last_page": 0,
-                    "total_pages_scraped": 0,
-                    "total_listings": 0,
-                    "last_run": None
-                },
-                "aa": {
-                    "last_page": 0,
-                    "total_pages_scraped": 0,
-                    "total_listings": 0,
-                    "last_run": None
-                },
-                "cazoo": {
-                    "last_page": 0,
-                    "total_pages_scraped": 0,
-                    "total_listings": 0,
-                    "last_run": None
-                },
-                "gumtree": {
-                    "last_page": 0,
-                    "total_pages_scraped": 0,
-                    "total_listings": 0,
-                    "last_run": None
-                }
-            })
+            save_progress(default_progress())
             print("✅ Progress reset complete")
         elif sys.argv[1] == "--status":
             # Show status only
@@ -372,9 +379,9 @@ if __name__ == "__main__":
             print("📊 SCRAPER STATUS")
             print("="*50)
             print("\nProgress:")
-            print(json.dumps(progress, indent=2))
+            print(_json_dumps(progress).decode())
             print("\nDatabase Stats:")
-            print(json.dumps(stats, indent=2))
+            print(_json_dumps(stats).decode())
         else:
             print("Usage:")
             print("  python run_all.py          # Run scrapers")
@@ -383,33 +390,12 @@ if __name__ == "__main__":
     else:
         # Normal run
         try:
-            asyncio.run(main())
+            # libuv event loop when installed, otherwise the default one
+            if uvloop:
+                uvloop.run(main())
+            else:
+                asyncio.run(main())
         except KeyboardInterrupt:
             print("\n⚠️ Scraping interrupted by user")
-        except Exception as e:
-            print(f"\n❌ Fatal error: {e}")
-            import traceback
-            traceback.print_exc()
-
-def save_to_csv(rows, filename):
-    if not rows:
-        print("No data to save to CSV.")
-        return
-    # Flatten the nested dict for CSV
-    flat_rows = []
-    for r in rows:
-        flat = {}
-        flat.update(r.get('vehicle', {}))
-        flat.update(r.get('dealer', {}))
-        flat['listing_url'] = r.get('listing_url')
-        flat_rows.append(flat)
-    # Get all possible keys
-    keys = set()
-    for row in flat_rows:
-        keys.update(row.keys())
-    keys = list(keys)
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=keys)
-        writer.writeheader()
-        writer.writerows(flat_rows)
-    print(f"✅ Saved {len(flat_rows)} rows to {filename}")
\ No newline at end of file
+        except Exception:
+            log.exception("❌ Fatal error")
@@ -6,107 +6,202 @@
 
 import asyncio, re, json, os, sys
 from typing import List, Dict, Optional, Tuple
+from aiolimiter import AsyncLimiter
 from crawl4ai import AsyncWebCrawler
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, parse_qs, urlencode
 from db_helper import save_to_raw_source
 
-FETCH_JS = """
-    await new Promise(r => setTimeout(r, 3000));
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# lxml (C) parser; parsing runs in worker threads, off the event loop
+HTML_PARSER = "lxml"
+
+# Patterns used on every listing, compiled once
+YEAR_RE = re.compile(r'\b(19|20)\d{2}\b')
+PRICE_RE = re.compile(r'£([\d,]+)')
+NON_DIGIT_RE = re.compile(r'[^\d]')
+SPEC_LABEL_RE = re.compile('label|key')
+SPEC_VALUE_RE = re.compile('value|text')
+UTAG_DECL_RE = re.compile(r"var\s+utag_data")
+UTAG_BODY_RE = re.compile(r"utag_data\s*=\s*({.*?});", re.S)
+TEL_RE = re.compile(r"tel:")
+MAILTO_RE = re.compile(r"mailto:")
+WEBSITE_RE = re.compile("website", re.I)
+CONTACT_RE = re.compile("contact", re.I)
+
+# CSS selectors, defined once; the tuples are tried in order, first match wins
+LISTING_CARD_SELECTOR = (
+    'div[class*="vehicle-card"] a, '
+    'div[class*="car-card"] a, '
+    'article[class*="listing"] a, '
+    'div[class*="search-result"] a'
+)
+PRICE_SELECTORS = (
+    '.vehicle-price',
+    '[data-testid="vehicle-price"]',
+    '.price',
+    'span[class*="price"]',
+    'div[class*="price"]',
+)
+SPEC_SELECTOR = (
+    '.specs-panel li, '
+    '.vd-spec, '
+    'li[class*="spec"], '
+    'div[class*="specification"] li, '
+    'ul[class*="key-facts"] li'
+)
+DEALER_SELECTORS = (
+    '[data-testid="dealer-name"]',
+    '.dealer-name',
+    'h2[class*="dealer"]',
+    'div[class*="dealer-info"] h3',
+)
+DEALER_MODAL_SELECTOR = '.lightbox-dialog, [role="dialog"], .modal, .dealer-modal'
+LOCATION_SELECTORS = (
+    '[data-testid="dealer-location"]',
+    '.dealer-location',
+    'div[class*="location"]',
+)
+
+# Dealer modal labels, each followed by a <span> holding the value
+MODAL_FIELDS = (
+    ("name", re.compile("company name", re.I)),
+    ("address", re.compile("address", re.I)),
+    ("phone", re.compile("phone", re.I)),
+    ("email", re.compile("email", re.I)),
+)
+
+# Scroll to trigger lazy loading; readiness is then awaited with wait_for
+# conditions instead of fixed setTimeout sleeps
+SCROLL_JS = """
     window.scrollTo(0, document.body.scrollHeight);
-    await new Promise(r => setTimeout(r, 2000));
     window.scrollTo(0, 0);
-    await new Promise(r => setTimeout(r, 1000));
 """
 
+# Ready conditions: search page fully loaded (an empty last page has no
+# listing links to wait for) / listing heading rendered
+SEARCH_WAIT_FOR = "js:() => document.readyState === 'complete'"
+LISTING_WAIT_FOR = "css:h1"
+
 # Updated default search URL to use displaycars format
 DEFAULT_SEARCH_URL = "https://www.theaa.com/used-cars/displaycars?fullpostcode=PR267SY&travel=2000&priceto=2000&page=1"
 MAX_PAGES_HARVEST = 40   # how many search pages to walk when urls=None
 
+# Listing pages fetched concurrently, and the request rate they share
+# (politeness is the rate limit, not sleeps that hold a fetch slot)
+DETAIL_CONCURRENCY = 8
+DETAIL_RPS = 2
+# Search pages fetched at once while harvesting, with their own rate so a
+# harvest doesn't use up the listing budget
+HARVEST_CONCURRENCY = 3
+HARVEST_RPS = 1
+
+# Scraped listings are saved to raw_source in chunks of this many
+SAVE_CHUNK_ROWS = 100
+
+def _new_crawler() -> AsyncWebCrawler:
+    """Browser shared by every fetch of a run (one Chromium start per run)"""
+    return AsyncWebCrawler(verbose=False, headless=True)
+
 # ──────────────────────────────────────────────────────────────
 #  HARVESTER – collect car listing links from AA search pages
 # ──────────────────────────────────────────────────────────────
-async def _harvest_links(search_url: str, max_pages: int, start_page: int = 1) -> List[str]:
+def _parse_search_page(html: str) -> List[str]:
+    """Parse listing URLs out of one AA search results page"""
+    soup = BeautifulSoup(html, HTML_PARSER)
+    page_links = []
+    seen = set()
+    
+    # Method 1: Look for links with specific patterns
+    for a in soup.find_all("a", href=True):
+        href = a["href"]
+        # AA patterns: /cardetails/, /used-cars/cardetails/, or similar
+        if any(pattern in href for pattern in ['/cardetails/', '/vehicle/', '/car-details/']):
+            full_url = href if href.startswith("http") else f"https://www.theaa.com{href}"
+            clean_url = full_url.split("?", 1)[0]
+            if clean_url not in seen:
+                seen.add(clean_url)
+                page_links.append(clean_url)
+    
+    # Method 2: Look for listing cards with specific classes
+    listing_cards = soup.select(LISTING_CARD_SELECTOR)
+    
+    for card_link in listing_cards:
+        href = card_link.get('href', '')
+        if href and href != '#':
+            full_url = href if href.startswith("http") else f"https://www.theaa.com{href}"
+            clean_url = full_url.split("?", 1)[0]
+            if clean_url not in seen and 'theaa.com' in clean_url:
+                seen.add(clean_url)
+                page_links.append(clean_url)
+    
+    return page_links
+
+async def _harvest_links(crawler: AsyncWebCrawler, search_url: str, max_pages: int, start_page: int = 1) -> List[str]:
     """Harvest all car listing URLs from AA search pages"""
-    all_links = []
-    page = start_page
+    sem = asyncio.Semaphore(HARVEST_CONCURRENCY)
+    limiter = AsyncLimiter(HARVEST_RPS, 1)
     
-    while page <= start_page + max_pages - 1:
-        print(f"🔍 Harvesting page {page}...")
-        
+    async def fetch_page(page: int) -> Optional[List[str]]:
         # Update page number in URL
         parsed = urlparse(search_url)
         params = parse_qs(parsed.query)
         params['page'] = [str(page)]
         current_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}?{urlencode(params, doseq=True)}"
         
-        print(f"  📄 Fetching: {current_url}")
-        
-        async with AsyncWebCrawler(verbose=False, headless=True) as crawler:
-            res = await crawler.arun(url=current_url, timeout=45000, js_code=FETCH_JS)
+        async with sem, limiter:
+            print(f"🔍 Harvesting page {page}: {current_url}")
+            res = await crawler.arun(url=current_url, timeout=45000, js_code=SCROLL_JS,
+                                     wait_for=SEARCH_WAIT_FOR, wait_for_network_idle=True)
         
         if not res.success:
+            return None
+        return await asyncio.to_thread(_parse_search_page, res.html)
+    
+    # The page range is known up front, so fetch the pages together and
+    # then walk them in order, stopping where the sequential walk would
+    pages = range(start_page, start_page + max_pages)
+    results = await asyncio.gather(*(fetch_page(page) for page in pages))
+    
+    # Ordered, de-duplicated across pages as they are walked
+    all_links = []
+    seen = set()
+    for page, page_links in zip(pages, results):
+        if page_links is None:
             print(f"❌ Failed to fetch page {page}")
             break
-            
-        soup = BeautifulSoup(res.html, "html.parser")
-        page_links = []
-        
-        # Method 1: Look for links with specific patterns
-        for a in soup.find_all("a", href=True):
-            href = a["href"]
-            # AA patterns: /cardetails/, /used-cars/cardetails/, or similar
-            if any(pattern in href for pattern in ['/cardetails/', '/vehicle/', '/car-details/']):
-                full_url = href if href.startswith("http") else f"https://www.theaa.com{href}"
-                clean_url = full_url.split("?", 1)[0]
-                if clean_url not in page_links:
-                    page_links.append(clean_url)
-        
-        # Method 2: Look for listing cards with specific classes
-        listing_cards = soup.select(
-            'div[class*="vehicle-card"] a, '
-            'div[class*="car-card"] a, '
-            'article[class*="listing"] a, '
-            'div[class*="search-result"] a'
-        )
-        
-        for card_link in listing_cards:
-            href = card_link.get('href', '')
-            if href and href != '#':
-                full_url = href if href.startswith("http") else f"https://www.theaa.com{href}"
-                clean_url = full_url.split("?", 1)[0]
-                if clean_url not in page_links and 'theaa.com' in clean_url:
-                    page_links.append(clean_url)
-        
         if not page_links:
             print(f"⚠️ No listings found on page {page}, stopping harvest")
             break
-            
-        all_links.extend(page_links)
+        for link in page_links:
+            if link not in seen:
+                seen.add(link)
+                all_links.append(link)
         print(f"✅ Found {len(page_links)} listings on page {page}")
-        
-        # Check if there's a next page by looking for pagination or if we found listings
-        # If we found listings, assume there might be more pages
-        page += 1
-        await asyncio.sleep(1)  # Be nice to the server
     
-    # Remove duplicates while preserving order
-    unique_links = list(dict.fromkeys(all_links))
-    return unique_links
+    return all_links
 
 # ──────────────────────────────────────────────────────────────
 #  SINGLE LISTING PARSER - Enhanced extraction
 # ──────────────────────────────────────────────────────────────
-async def extract_aa_listing(url: str) -> Dict:
+async def extract_aa_listing(crawler: AsyncWebCrawler, url: str) -> Dict:
     """Extract detailed information from a single AA listing"""
-    async with AsyncWebCrawler(verbose=False, headless=True) as crawler:
-        res = await crawler.arun(url=url, timeout=45000, js_code=FETCH_JS)
+    res = await crawler.arun(url=url, timeout=45000, js_code=SCROLL_JS,
+                             wait_for=LISTING_WAIT_FOR, wait_for_network_idle=True)
     
     if not res.success:
         print(f"❌ Fetch failed {url}")
         return {}
+    
+    return await asyncio.to_thread(_parse_aa_listing, res.html, url)
 
-    soup = BeautifulSoup(res.html, "html.parser")
+def _parse_aa_listing(html: str, url: str) -> Dict:
+    """Parse a fetched AA listing page into a vehicle/dealer record"""
+    soup = BeautifulSoup(html, HTML_PARSER)
     row: Dict = {"listing_url": url, "vehicle": {}, "dealer": {}}
     v, d = row["vehicle"], row["dealer"]
 
@@ -116,7 +211,7 @@ async def extract_aa_listing(url: str) -> Dict:
         v["title"] = title
         
         # Extract year
-        if year_match := re.search(r'\b(19|20)\d{2}\b', title):
+        if year_match := YEAR_RE.search(title):
             v["year"] = year_match.group()
             title_clean = title.replace(year_match.group(), '').strip()
         else:
@@ -132,46 +227,32 @@ async def extract_aa_listing(url: str) -> Dict:
                 v["variant"] = " ".join(parts[2:])
 
     # 2. Price extraction - multiple methods
-    price_selectors = [
-        '.vehicle-price',
-        '[data-testid="vehicle-price"]',
-        '.price',
-        'span[class*="price"]',
-        'div[class*="price"]'
-    ]
-    
-    for selector in price_selectors:
+    for selector in PRICE_SELECTORS:
         if price_elem := soup.select_one(selector):
             price_text = price_elem.get_text(strip=True)
-            if price_match := re.search(r'£([\d,]+)', price_text):
+            if price_match := PRICE_RE.search(price_text):
                 v["price"] = f"£{price_match.group(1)}"
                 break
     
     # Also search in text
     if "price" not in v:
-        if price_text := soup.find(string=re.compile(r'£[\d,]+')):
-            if price_match := re.search(r'£([\d,]+)', str(price_text)):
+        if price_text := soup.find(string=PRICE_RE):
+            if price_match := PRICE_RE.search(str(price_text)):
                 v["price"] = f"£{price_match.group(1)}"
 
     # 3. Specifications - Enhanced extraction
-    spec_containers = soup.select(
-        '.specs-panel li, '
-        '.vd-spec, '
-        'li[class*="spec"], '
-        'div[class*="specification"] li, '
-        'ul[class*="key-facts"] li'
-    )
+    spec_containers = soup.select(SPEC_SELECTOR)
     
     for spec in spec_containers:
-        label_elem = spec.find(['span', 'div'], class_=re.compile('label|key'))
-        value_elem = spec.find(['span', 'div'], class_=re.compile('value|text'))
+        label_elem = spec.find(['span', 'div'], class_=SPEC_LABEL_RE)
+        value_elem = spec.find(['span', 'div'], class_=SPEC_VALUE_RE)
         
         if label_elem and value_elem:
             label = label_elem.get_text(strip=True).lower()
             value = value_elem.get_text(strip=True)
             
             if 'mileage' in label:
-                v["mileage"] = re.sub(r'[^\d]', '', value)
+                v["mileage"] = NON_DIGIT_RE.sub('', value)
             elif 'year' in label and 'year' not in v:
                 v["year"] = value
             elif 'fuel' in label:
@@ -186,10 +267,11 @@ async def extract_aa_listing(url: str) -> Dict:
                 v["model"] = value
 
     # 4. utag_data script extraction
-    if script := soup.find("script", string=re.compile("var\\s+utag_data")):
-        if match := re.search(r"utag_data\s*=\s*({.*?});", script.string or "", re.S):
+    if script := soup.find("script", string=UTAG_DECL_RE):
+        if match := UTAG_BODY_RE.search(script.string or ""):
             try:
-                utag = json.loads(match.group(1))
+                # orjson when available (it accepts str as well as bytes)
+                utag = orjson.loads(match.group(1)) if orjson else json.loads(match.group(1))
                 
                 # Vehicle data mapping
                 mapping = {
@@ -215,65 +297,45 @@ async def extract_aa_listing(url: str) -> Dict:
                 print(f"⚠️ Failed to parse utag_data: {e}")
 
     # 5. Dealer information extraction (improved)
-    dealer_selectors = [
-        '[data-testid="dealer-name"]',
-        '.dealer-name',
-        'h2[class*="dealer"]',
-        'div[class*="dealer-info"] h3'
-    ]
-    for selector in dealer_selectors:
+    for selector in DEALER_SELECTORS:
         if dealer_elem := soup.select_one(selector):
             d.setdefault("name", dealer_elem.get_text(strip=True))
             break
     # Try to extract from overlays/modals
-    modal = soup.select_one('.lightbox-dialog, [role="dialog"], .modal, .dealer-modal')
+    modal = soup.select_one(DEALER_MODAL_SELECTOR)
     if modal:
-        # Company name
-        name_elem = modal.find(string=re.compile("company name", re.I))
-        if name_elem and name_elem.parent:
-            next_elem = name_elem.parent.find_next('span')
-            if next_elem:
-                d["name"] = next_elem.get_text(strip=True)
-        # Address
-        address_elem = modal.find(string=re.compile("address", re.I))
-        if address_elem and address_elem.parent:
-            next_elem = address_elem.parent.find_next('span')
-            if next_elem:
-                d["address"] = next_elem.get_text(strip=True)
-        # Phone
-        phone_elem = modal.find(string=re.compile("phone", re.I))
-        if phone_elem and phone_elem.parent:
-            next_elem = phone_elem.parent.find_next('span')
-            if next_elem:
-                d["phone"] = next_elem.get_text(strip=True)
-        # Email
-        email_elem = modal.find(string=re.compile("email", re.I))
-        if email_elem and email_elem.parent:
-            next_elem = email_elem.parent.find_next('span')
-            if next_elem:
-                d["email"] = next_elem.get_text(strip=True)
-    # Phone number (main page)
-    if tel := soup.find("a", href=re.compile(r"tel:")):
+        for field, label_re in MODAL_FIELDS:
+            label_elem = modal.find(string=label_re)
+            if label_elem and label_elem.parent:
+                next_elem = label_elem.parent.find_next('span')
+                if next_elem:
+                    d[field] = next_elem.get_text(strip=True)
+    # Phone, email, website and contact form links (main page), found in a
+    # single pass over the anchors; the first match of each wins
+    tel = email_elem = website_elem = contact_form = None
+    for a in soup.find_all("a", href=True):
+        href = a["href"]
+        text = a.string
+        if tel is None and TEL_RE.search(href):
+            tel = a
+        if email_elem is None and MAILTO_RE.search(href):
+            email_elem = a
+        if website_elem is None and text and WEBSITE_RE.search(text):
+            website_elem = a
+        if contact_form is None and text and CONTACT_RE.search(text):
+            contact_form = a
+        if tel and email_elem and website_elem and contact_form:
+            break
+    if tel:
         d["phone"] = tel["href"].split(":", 1)[1]
-    # Email (main page)
-    email_elem = soup.find("a", href=re.compile(r"mailto:"))
     if email_elem:
         d["email"] = email_elem["href"].split(":", 1)[1]
-    # Website
-    website_elem = soup.find("a", href=True, string=re.compile("website", re.I))
     if website_elem:
         d["website"] = website_elem["href"]
-    # Contact form
-    contact_form = soup.find("a", href=True, string=re.compile("contact", re.I))
     if contact_form:
         d["contact_form_url"] = contact_form["href"]
     # Location
-    location_selectors = [
-        '[data-testid="dealer-location"]',
-        '.dealer-location',
-        'div[class*="location"]'
-    ]
-    for selector in location_selectors:
+    for selector in LOCATION_SELECTORS:
         if loc_elem := soup.select_one(selector):
             location = loc_elem.get_text(strip=True)
             d["location"] = location
@@ -282,7 +344,7 @@ async def extract_aa_listing(url: str) -> Dict:
             break
     # Clean up mileage if it exists
     if mileage := v.get("mileage"):
-        v["mileage"] = re.sub(r'[^\d]', '', str(mileage))
+        v["mileage"] = NON_DIGIT_RE.sub('', str(mileage))
     print(f"✅ Extracted: {v.get('make')} {v.get('model')} {v.get('year')} - £{v.get('price', 'N/A')}")
     return row if v else {}
 
@@ -293,14 +355,22 @@ async def run_aa(
     urls: Optional[List[str]] = None, 
     batch_size: int = 100,
     batch_pages: int = 3,
-    start_page: int = 1
+    start_page: int = 1,
+    crawler: Optional[AsyncWebCrawler] = None,
+    sem: Optional[asyncio.Semaphore] = None
 ) -> List[Dict]:
     """
     Main entry point for AA scraper
     - If urls provided: scrape those specific listings
     - Otherwise: harvest from search pages and scrape
     - Supports pagination with start_page parameter
+    - Reuses `crawler` if given, otherwise opens one browser for the whole run
+    - `sem` caps concurrent listing fetches (default: DETAIL_CONCURRENCY)
     """
+    if crawler is None:
+        async with _new_crawler() as crawler:
+            return await run_aa(urls, batch_size, batch_pages, start_page, crawler, sem)
+    
     if urls is None:
         print("🔍 Starting AA harvest...")
         print(f"📄 Pages: {start_page} to {start_page + batch_pages - 1}")
@@ -308,34 +378,51 @@ async def run_aa(
         # Construct search URL with start page
         search_url = f"https://www.theaa.com/used-cars/displaycars?fullpostcode=PR267SY&travel=2000&priceto=2000&page={start_page}"
         
-        urls = await _harvest_links(search_url, batch_pages, start_page)
+        urls = await _harvest_links(crawler, search_url, batch_pages, start_page)
         print(f"✅ Harvested {len(urls)} detail URLs")
         
         if not urls:
             print("❌ No URLs harvested!")
             return []
     
-    rows: List[Dict] = []
     urls_to_scrape = urls[:batch_size]
+    if sem is None:
+        sem = asyncio.Semaphore(DETAIL_CONCURRENCY)
+    limiter = AsyncLimiter(DETAIL_RPS, 1)
+    pending: List[Dict] = []
     
-    print(f"🚗 Scraping {len(urls_to_scrape)} AA listings...")
+    async def flush():
+        # Take the chunk before awaiting so concurrent fetches can't save it twice
+        chunk = pending[:]
+        pending.clear()
+        if chunk:
+            await asyncio.to_thread(save_to_raw_source, chunk, 'the_aa')
     
-    for i, url in enumerate(urls_to_scrape, 1):
-        try:
-            print(f"[{i}/{len(urls_to_scrape)}] ", end="")
-            rec = await extract_aa_listing(url)
-            if rec and rec.get("vehicle"):
-                rows.append(rec)
-                # Save immediately to raw_source (pass full record)
-                save_to_raw_source([rec], 'the_aa')
-            else:
-                print(f"⚠️ No data from {url}")
-        except Exception as e:
-            print(f"❌ Error on {url}: {e}")
-        
-        # Rate limiting
-        if i < len(urls_to_scrape):
-            await asyncio.sleep(1.5)
+    async def fetch_one(url: str) -> Dict:
+        async with sem:
+            async with limiter:
+                rec = await extract_aa_listing(crawler, url)
+        if rec and rec.get("vehicle"):
+            # Save to raw_source in chunks as the batch goes, off the loop,
+            # so a crash mid-batch keeps what was already scraped. The fetch
+            # slot is already released, so other fetches run during the save.
+            pending.append(rec)
+            if len(pending) >= SAVE_CHUNK_ROWS:
+                await flush()
+        return rec
+    
+    print(f"🚗 Scraping {len(urls_to_scrape)} AA listings concurrently...")
+    results = await asyncio.gather(*(fetch_one(url) for url in urls_to_scrape), return_exceptions=True)
+    await flush()
+    
+    rows: List[Dict] = []
+    for url, rec in zip(urls_to_scrape, results):
+        if isinstance(rec, Exception):
+            print(f"❌ Error on {url}: {rec}")
+        elif rec and rec.get("vehicle"):
+            rows.append(rec)
+        else:
+            print(f"⚠️ No data from {url}")
     
     print(f"\n✅ Successfully scraped {len(rows)} listings")
     return rows
@@ -14,7 +14,7 @@ from urllib.parse import urlparse, parse_qs, urlencode
 from crawl4ai import AsyncWebCrawler
 from bs4 import BeautifulSoup
 from datetime import datetime
-from db_helper import save_to_leads
+from db_helper import save_to_raw_source
 
 # JavaScript to ensure page loads properly
 FETCH_JS = """
@@ -48,6 +48,9 @@ FETCH_JS = """
 DEFAULT_SEARCH_URL = "https://www.cazoo.co.uk/cars/?page=1"
 MAX_PAGES_HARVEST = 40  # Maximum pages to scrape when no URLs provided
 
+# lxml (C) parser; parsing runs in worker threads, off the event loop
+HTML_PARSER = "lxml"
+
 # ──────────────────────────────────────────────────────────────
 #  HARVESTER – collect car listing links from Cazoo search pages
 # ──────────────────────────────────────────────────────────────
@@ -93,7 +96,7 @@ async def _harvest_links(search_url: str, max_pages: int) -> List[str]:
             
         print(f"  📄 Page size: {len(res.html)} bytes")
         
-        soup = BeautifulSoup(res.html, "html.parser")
+        soup = await asyncio.to_thread(BeautifulSoup, res.html, HTML_PARSER)
         page_links = []
         
         # Debug: Check page title and structure
@@ -171,7 +174,7 @@ async def extract_cazoo_listing(url: str) -> Dict:
         print(f"❌ Fetch failed {url}")
         return {}
     
-    soup = BeautifulSoup(res.html, "html.parser")
+    soup = await asyncio.to_thread(BeautifulSoup, res.html, HTML_PARSER)
     
     # Check if it's an error page
     page_text = soup.get_text()
@@ -539,7 +542,8 @@ async def run_cazoo(
     
     print(f"\n🚗 Scraping {len(car_listing_urls)} actual car listings...")
     
-    rows: List[Dict] = []
+    all_rows: List[Dict] = []  # Everything scraped, returned to the caller
+    rows: List[Dict] = []  # Save buffer, cleared after each batch save
     batch_save_size = 10  # Save every 10 records
     
     for i, url in enumerate(car_listing_urls, 1):
@@ -547,11 +551,12 @@ async def run_cazoo(
             print(f"[{i}/{len(car_listing_urls)}] ", end="")
             rec = await extract_cazoo_listing(url)
             if rec and rec.get("vehicle"):
+                all_rows.append(rec)
                 rows.append(rec)
                 
                 # Save in batches
                 if len(rows) >= batch_save_size:
-                    save_to_leads(rows, 'cazoo')
+                    await asyncio.to_thread(save_to_raw_source, rows, 'cazoo')
                     rows = []  # Clear the batch
             else:
                 print(f"⚠️ No valid data from {url}")
@@ -564,12 +569,12 @@ async def run_cazoo(
     
     # Save any remaining records
     if rows:
-        save_to_leads(rows, 'cazoo')
+        await asyncio.to_thread(save_to_raw_source, rows, 'cazoo')
     
-    print(f"\n✅ Successfully scraped {len(car_listing_urls)} listings")
+    print(f"\n✅ Successfully scraped {len(all_rows)} listings")
     
     # Return all scraped records for the caller
-    return rows
+    return all_rows
 
 # ──────────────────────────────────────────────────────────────
 #  CLI TEST
@@ -48,6 +48,9 @@ FETCH_JS = """
 DEFAULT_SEARCH_URL = "https://www.gumtree.com/search?search_category=cars&search_location=uk&max_price=2000&seller_type=trade&page=1"
 MAX_PAGES_HARVEST = 20  # Maximum pages to scrape when no URLs provided
 
+# lxml (C) parser; parsing runs in worker threads, off the event loop
+HTML_PARSER = "lxml"
+
 # ──────────────────────────────────────────────────────────────
 #  HARVESTER – collect car listing links from Gumtree search pages
 # ──────────────────────────────────────────────────────────────
@@ -93,7 +96,7 @@ async def _harvest_links(search_url: str, max_pages: int) -> List[str]:
             
         print(f"  📄 Page size: {len(res.html)} bytes")
         
-        soup = BeautifulSoup(res.html, "html.parser")
+        soup = await asyncio.to_thread(BeautifulSoup, res.html, HTML_PARSER)
         page_links = []
         
         # Debug: Check page title and structure
@@ -198,7 +201,7 @@ async def extract_gumtree_listing(url: str) -> Dict:
         print(f"❌ Fetch failed {url}")
         return {}
     
-    soup = BeautifulSoup(res.html, "html.parser")
+    soup = await asyncio.to_thread(BeautifulSoup, res.html, HTML_PARSER)
     
     # Check if it's an error page
     page_text = soup.get_text()
@@ -463,7 +466,8 @@ async def run_gumtree(
     
     print(f"\n🚗 Scraping {len(car_listing_urls)} actual car listings...")
     
-    rows: List[Dict] = []
+    all_rows: List[Dict] = []  # Everything scraped, returned to the caller
+    rows: List[Dict] = []  # Save buffer, cleared after each batch save
     batch_save_size = 10  # Save every 10 records
     
     for i, url in enumerate(car_listing_urls, 1):
@@ -471,10 +475,11 @@ async def run_gumtree(
             print(f"[{i}/{len(car_listing_urls)}] ", end="")
             rec = await extract_gumtree_listing(url)
             if rec and rec.get("vehicle"):
+                all_rows.append(rec)
                 rows.append(rec)
                 # Save in batches to raw_source
                 if len(rows) >= batch_save_size:
-                    save_to_raw_source(rows, 'gumtree')
+                    await asyncio.to_thread(save_to_raw_source, rows, 'gumtree')
                     rows = []  # Clear the batch
             else:
                 print(f"⚠️ No valid data from {url}")
@@ -485,12 +490,12 @@ async def run_gumtree(
             await asyncio.sleep(2)
     # Save any remaining records
     if rows:
-        save_to_raw_source(rows, 'gumtree')
+        await asyncio.to_thread(save_to_raw_source, rows, 'gumtree')
     
-    print(f"\n✅ Successfully scraped {len(car_listing_urls)} listings")
+    print(f"\n✅ Successfully scraped {len(all_rows)} listings")
     
     # Return all scraped records for the caller
-    return rows
+    return all_rows
 
 # ──────────────────────────────────────────────────────────────
 #  CLI TEST
@@ -4,34 +4,54 @@
 • Proper pagination continuation
 """
 
-import asyncio, re, os, json
-from typing import List, Dict, Tuple, Optional
-from urllib.parse import urlparse, parse_qs, urlencode
+import asyncio, re, os, json, random
+from typing import List, Dict, Optional
 from crawl4ai import AsyncWebCrawler
 from bs4 import BeautifulSoup
 from datetime import datetime
-from db_helper import save_to_leads
+from db_helper import save_to_raw_source, get_existing_listing_urls
 
 # ──────────────────────────────────────────────────────────────
 #  CONSTANTS & JS HELPER
 # ──────────────────────────────────────────────────────────────
-FETCH_JS = """
-    // Wait for page to load
-    await new Promise(r => setTimeout(r, 4000));
-    
-    // Scroll to trigger lazy loading
+# Trade listings up to £2,000; pages are numbered from 1
+SEARCH_URL = (
+    "https://www.pistonheads.com/buy/search"
+    "?price=0&price=2000&seller-type=Trade"
+    "&page={page}"
+)
+
+# lxml (C) parser; parsing runs in worker threads, off the event loop
+HTML_PARSER = "lxml"
+
+# Patterns used on every listing, compiled once
+TITLE_YEAR_RE = re.compile(r'\b(19[89]\d|20[012]\d)\b')
+YEAR_RE = re.compile(r'(19[89]\d|20[012]\d)')
+PRICE_RE = re.compile(r'£?([\d,]+)')
+MILES_RE = re.compile(r'([\d,]+)\s*miles')
+NON_DIGIT_RE = re.compile(r'[^\d]')
+# Checked in priority order, not by position in the text: "hybrid petrol"
+# is Petrol and "semi-automatic" is Automatic
+FUEL_TYPES = ('petrol', 'diesel', 'electric', 'hybrid')
+GEARBOX_TYPES = ('manual', 'automatic', 'semi-auto')
+
+# Listing detail pages fetched concurrently (shared browser, separate tabs)
+DETAIL_CONCURRENCY = 8
+# Random pause per fetch slot, replaces the fixed 2s between listings
+DETAIL_DELAY_RANGE = (0.5, 2.0)
+
+# Scroll to trigger lazy loading; readiness is then awaited with wait_for
+# conditions instead of fixed setTimeout sleeps
+SCROLL_JS = """
     window.scrollTo(0, document.body.scrollHeight);
-    await new Promise(r => setTimeout(r, 2000));
-    
-    // Scroll back up
     window.scrollTo(0, 0);
-    await new Promise(r => setTimeout(r, 1000));
-    
-    // Check if content is loaded
-    const listings = document.querySelectorAll('a[href*="/buy/listing/"]');
-    console.log('Found listings:', listings.length);
 """
 
+# Ready condition for search and listing pages. Not a selector: a page past
+# the last result (no listing links) or a removed listing (no h1) would never
+# match one and sit out every timeout; the parsers decide what's missing.
+PAGE_WAIT_FOR = "js:() => document.readyState === 'complete'"
+
 # ──────────────────────────────────────────────────────────────
 #  DEBUG HELPERS
 # ──────────────────────────────────────────────────────────────
@@ -47,32 +67,37 @@ def save_debug_html(html: str, filename: str):
 # ──────────────────────────────────────────────────────────────
 #  PAGE‑LEVEL HELPERS
 # ──────────────────────────────────────────────────────────────
-async def _fetch_html(url: str, save_debug: bool = False) -> str:
-    """Fetch HTML content from URL with retries"""
+def _new_crawler() -> AsyncWebCrawler:
+    """Browser shared by every fetch of a run (one Chromium start per run)"""
+    return AsyncWebCrawler(
+        verbose=False, 
+        headless=True,
+        browser_type="chromium",
+        page_timeout=60000,
+        remove_overlay_elements=True
+    )
+
+async def _fetch_html(crawler: AsyncWebCrawler, url: str, wait_for: str,
+                      js_code: Optional[str] = None, save_debug: bool = False) -> str:
+    """Fetch HTML content from URL with retries, returning once the page is loaded"""
     for attempt in range(3):
         try:
-            async with AsyncWebCrawler(
-                verbose=False, 
-                headless=True,
-                browser_type="chromium",
-                page_timeout=60000,
-                remove_overlay_elements=True
-            ) as crawler:
-                res = await crawler.arun(
-                    url=url, 
-                    timeout=60000, 
-                    js_code=FETCH_JS,
-                    wait_for_network_idle=True,
-                    bypass_cache=True
-                )
+            res = await crawler.arun(
+                url=url, 
+                timeout=60000, 
+                js_code=js_code,
+                wait_for=wait_for,
+                wait_for_network_idle=True,
+                bypass_cache=True
+            )
+            
+            if res.success and res.html and len(res.html) > 1000:
+                if save_debug:
+                    save_debug_html(res.html, f"page_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
+                return res.html
+            else:
+                print(f"  ⚠️ Attempt {attempt + 1}: Page too small ({len(res.html or '')} bytes)")
                 
-                if res.success and res.html and len(res.html) > 1000:
-                    if save_debug:
-                        save_debug_html(res.html, f"page_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-                    return res.html
-                else:
-                    print(f"  ⚠️ Attempt {attempt + 1}: Page too small ({len(res.html)} bytes)")
-                    
         except Exception as e:
             print(f"  ⚠️ Attempt {attempt + 1} failed: {e}")
             
@@ -81,34 +106,35 @@ async def _fetch_html(url: str, save_debug: bool = False) -> str:
     
     return ""
 
-async def extract_listings_and_next_page(search_url: str) -> Tuple[List[str], Optional[str]]:
-    """Extract listing URLs from search page and determine next page"""
+async def extract_listings(crawler: AsyncWebCrawler, search_url: str) -> List[str]:
+    """Extract listing URLs from a search page"""
     print(f"🔍 Processing search page: {search_url}")
     
-    html = await _fetch_html(search_url, save_debug=True)
+    html = await _fetch_html(crawler, search_url, PAGE_WAIT_FOR, js_code=SCROLL_JS, save_debug=True)
     if not html:
         print("❌ Failed to fetch search page")
-        return [], None
+        return []
         
-    soup = BeautifulSoup(html, "html.parser")
+    soup = await asyncio.to_thread(BeautifulSoup, html, HTML_PARSER)
     urls: List[str] = []
+    seen = set()
     
     # Debug: Check if we're on the right page
     title = soup.find('title')
     if title:
         print(f"  📄 Page title: {title.text.strip()}")
     
-    # Method 1: Direct link search
-    all_links = soup.find_all("a", href=True)
-    print(f"  🔗 Total links found: {len(all_links)}")
+    # Method 1: Direct link search (filtered by the CSS engine, not per anchor in Python)
+    listing_links = soup.select('a[href*="/buy/listing/"]:not([href*="thumb"])')
+    print(f"  🔗 Listing links found: {len(listing_links)}")
     
-    for a in all_links:
+    for a in listing_links:
         href = a["href"]
-        if "/buy/listing/" in href and "thumb" not in href and href != '#':
-            full_url = href if href.startswith("http") else f"https://www.pistonheads.com{href}"
-            clean_url = full_url.split("?", 1)[0]
-            if clean_url not in urls and 'pistonheads.com' in clean_url:
-                urls.append(clean_url)
+        full_url = href if href.startswith("http") else f"https://www.pistonheads.com{href}"
+        clean_url = full_url.split("?", 1)[0]
+        if clean_url not in seen and 'pistonheads.com' in clean_url:
+            seen.add(clean_url)
+            urls.append(clean_url)
     
     # Method 2: Look for listing containers
     if not urls:
@@ -125,11 +151,10 @@ async def extract_listings_and_next_page(search_url: str) -> Tuple[List[str], Op
             if href and '/listing/' in href:
                 full_url = href if href.startswith("http") else f"https://www.pistonheads.com{href}"
                 clean_url = full_url.split("?", 1)[0]
-                if clean_url not in urls:
+                if clean_url not in seen:
+                    seen.add(clean_url)
                     urls.append(clean_url)
     
-    # Remove duplicates
-    urls = list(dict.fromkeys(urls))
     print(f"✅ Found {len(urls)} listings on this page")
     
     if urls:
@@ -137,26 +162,14 @@ async def extract_listings_and_next_page(search_url: str) -> Tuple[List[str], Op
         for i, url in enumerate(urls[:3], 1):
             print(f"     {i}. {url}")
     
-    # Find next page
-    next_url = None
-    parsed = urlparse(search_url)
-    params = parse_qs(parsed.query)
-    current_page = int(params.get("page", ["1"])[0])
-    
-    # Always construct next page URL if we found listings
-    if urls:
-        params["page"] = [str(current_page + 1)]
-        next_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}?{urlencode(params, doseq=True)}"
-        print(f"➡️ Next page: {next_url}")
-    
-    return urls, next_url
+    return urls
 
-async def extract_listing_details(listing_url: str) -> Dict:
+async def extract_listing_details(crawler: AsyncWebCrawler, listing_url: str) -> Dict:
     """Extract detailed information from a PistonHeads listing"""
     print(f"  🚗 Processing: {listing_url}")
     
     # Fetch with longer timeout for detail pages
-    html = await _fetch_html(listing_url)
+    html = await _fetch_html(crawler, listing_url, PAGE_WAIT_FOR)
     if not html:
         print("  ❌ Failed to fetch listing")
         return {}
@@ -168,7 +181,12 @@ async def extract_listing_details(listing_url: str) -> Dict:
         save_debug_html(html, f"listing_{globals()['debug_listing']}_{listing_url.split('/')[-1]}.html")
         globals()["debug_listing"] += 1
 
-    soup = BeautifulSoup(html, 'html.parser')
+    # Parse and extract in a worker thread so other fetches keep running
+    return await asyncio.to_thread(_parse_listing_details, html, listing_url)
+
+def _parse_listing_details(html: str, listing_url: str) -> Dict:
+    """Parse a fetched PistonHeads listing page into a vehicle/dealer record"""
+    soup = BeautifulSoup(html, HTML_PARSER)
     data = {"listing_url": listing_url, "vehicle": {}, "dealer": {}}
     v, d = data['vehicle'], data['dealer']
 
@@ -199,7 +217,7 @@ async def extract_listing_details(listing_url: str) -> Dict:
         print(f"    📝 Title: {title}")
         
         # Extract year
-        year_match = re.search(r'\b(19[89]\d|20[012]\d)\b', title)
+        year_match = TITLE_YEAR_RE.search(title)
         if year_match:
             v['year'] = year_match.group()
             title_clean = title.replace(year_match.group(), '').strip()
@@ -238,7 +256,7 @@ async def extract_listing_details(listing_url: str) -> Dict:
                 break
     
     if price_text:
-        if price_match := re.search(r'£?([\d,]+)', price_text):
+        if price_match := PRICE_RE.search(price_text):
             v['price'] = f"£{price_match.group(1)}"
             print(f"    💰 Price: {v['price']}")
 
@@ -258,7 +276,7 @@ async def extract_listing_details(listing_url: str) -> Dict:
                     v['year'] = value
                     specs_found = True
                 elif 'mileage' in label:
-                    v['mileage'] = re.sub(r'[^\d]', '', value)
+                    v['mileage'] = NON_DIGIT_RE.sub('', value)
                     specs_found = True
                 elif 'fuel' in label:
                     v['fuel_type'] = value
@@ -272,39 +290,43 @@ async def extract_listing_details(listing_url: str) -> Dict:
     
     # Method 2: Key-value pairs in lists
     if not specs_found:
-        for container in soup.select('ul.key-facts li, ul.specs li, div.specs-list li'):
-            text = container.get_text(' ', strip=True).lower()
-            
-            # Mileage
-            if mileage_match := re.search(r'([\d,]+)\s*miles', text):
-                v['mileage'] = mileage_match.group(1).replace(',', '')
-            
-            # Year
-            if year_match := re.search(r'(19[89]\d|20[012]\d)', text):
-                v.setdefault('year', year_match.group(1))
-            
-            # Fuel
-            for fuel in ['petrol', 'diesel', 'electric', 'hybrid']:
-                if fuel in text:
-                    v.setdefault('fuel_type', fuel.title())
-                    break
-            
-            # Gearbox
-            for gb in ['manual', 'automatic', 'semi-auto']:
-                if gb in text:
-                    v.setdefault('gearbox', gb.capitalize())
-                    break
+        # Join all spec items into one lower-case blob and scan it once per pattern
+        text = " | ".join(
+            li.get_text(' ', strip=True).lower()
+            for li in soup.select('ul.key-facts li, ul.specs li, div.specs-list li')
+        )
+        
+        # Mileage (last item wins, as before)
+        if mileage_matches := MILES_RE.findall(text):
+            v['mileage'] = mileage_matches[-1].replace(',', '')
+        
+        # Year
+        if year_match := YEAR_RE.search(text):
+            v.setdefault('year', year_match.group(1))
+        
+        # Fuel
+        for fuel in FUEL_TYPES:
+            if fuel in text:
+                v.setdefault('fuel_type', fuel.title())
+                break
+        
+        # Gearbox
+        for gb in GEARBOX_TYPES:
+            if gb in text:
+                v.setdefault('gearbox', gb.capitalize())
+                break
 
     # Method 3: Generic text search as fallback
     if not v.get('mileage') or not v.get('fuel_type'):
         all_text = soup.get_text(' ', strip=True).lower()
         
         if not v.get('mileage'):
-            if mileage_match := re.search(r'([\d,]+)\s*miles', all_text):
+            if mileage_match := MILES_RE.search(all_text):
                 v['mileage'] = mileage_match.group(1).replace(',', '')
         
         if not v.get('fuel_type'):
-            for fuel in ['petrol', 'diesel', 'electric', 'hybrid']:
+            # A page can mention e.g. "electric windows" before the fuel
+            for fuel in FUEL_TYPES:
                 if fuel in all_text:
                     v['fuel_type'] = fuel.title()
                     break
@@ -327,7 +349,7 @@ async def extract_listing_details(listing_url: str) -> Dict:
             break
     
     # Phone number
-    if tel := soup.find('a', href=re.compile(r'tel:')):
+    if tel := soup.select_one('a[href*="tel:"]'):
         d['phone'] = tel['href'].split(':', 1)[1]
         print(f"    📞 Phone: {d['phone']}")
     
@@ -355,34 +377,51 @@ async def extract_listing_details(listing_url: str) -> Dict:
 # ──────────────────────────────────────────────────────────────
 #  PUBLIC BATCH RUNNER (for orchestrator)
 # ──────────────────────────────────────────────────────────────
-async def run_pistonheads(batch_pages: int = 5, start_page: int = 1, max_per_page: int = 60) -> List[Dict]:
+async def run_pistonheads(batch_pages: int = 5, start_page: int = 1, max_per_page: int = 60,
+                          crawler: Optional[AsyncWebCrawler] = None, skip_existing: bool = True,
+                          sem: Optional[asyncio.Semaphore] = None) -> int:
     """
     Main entry point for PistonHeads scraper
     - Scrapes multiple pages of search results
     - Extracts detailed information from each listing
+    - Saves each page to raw_source as it completes
+    - Returns the listings covered: saved now plus already in raw_source,
+      so a page window of known listings still counts as scraped
+    - Reuses `crawler` if given, otherwise opens one browser for the whole run
+    - With `skip_existing`, listings already in raw_source are not fetched again
+    - `sem` caps concurrent listing fetches (default: DETAIL_CONCURRENCY)
     """
-    rows: List[Dict] = []
+    if crawler is None:
+        async with _new_crawler() as crawler:
+            return await run_pistonheads(batch_pages, start_page, max_per_page, crawler, skip_existing, sem)
+    
+    total_listings = 0
+    skipped_listings = 0
+    if sem is None:
+        sem = asyncio.Semaphore(DETAIL_CONCURRENCY)
+    
+    async def fetch_one(url: str) -> Dict:
+        async with sem:
+            rec = await extract_listing_details(crawler, url)
+            # Rate limiting
+            await asyncio.sleep(random.uniform(*DETAIL_DELAY_RANGE))
+            return rec
+    
     current_page = start_page
     pages_processed = 0
     consecutive_empty_pages = 0
-    
-    # Initial search URL
-    search_url = (
-        f"https://www.pistonheads.com/buy/search"
-        f"?price=0&price=2000&seller-type=Trade"
-        f"&page={current_page}"
-    )
+    save_task: Optional[asyncio.Task] = None
     
     print(f"🚗 Starting PistonHeads scraper")
     print(f"📄 Pages: {start_page} to {start_page + batch_pages - 1}")
-    print(f"🔗 Base URL: {search_url}")
+    print(f"🔗 Base URL: {SEARCH_URL.format(page=start_page)}")
     print("-" * 60)
     
     while pages_processed < batch_pages and consecutive_empty_pages < 2:
         print(f"\n📄 Page {current_page}:")
         
         # Get listings from current page
-        listing_urls, next_url = await extract_listings_and_next_page(search_url)
+        listing_urls = await extract_listings(crawler, SEARCH_URL.format(page=current_page))
         
         if not listing_urls:
             consecutive_empty_pages += 1
@@ -397,48 +436,54 @@ async def run_pistonheads(batch_pages: int = 5, start_page: int = 1, max_per_pag
         # Limit listings per page if specified
         urls_to_process = listing_urls[:max_per_page] if max_per_page else listing_urls
         
-        # Extract details from each listing
+        # Skip listings saved by earlier runs (one DB lookup per page, off the loop)
+        if skip_existing and urls_to_process:
+            existing = await asyncio.to_thread(get_existing_listing_urls, 'piston_heads', urls_to_process)
+            if existing:
+                urls_to_process = [url for url in urls_to_process if url not in existing]
+                skipped_listings += len(existing)
+                print(f"  ⏭️ Skipping {len(existing)} listings already in the database")
+        
+        # Extract details from the listings concurrently
+        print(f"  🚗 Fetching {len(urls_to_process)} listings concurrently")
+        results = await asyncio.gather(*(fetch_one(url) for url in urls_to_process), return_exceptions=True)
+        
         page_results = []
-        for i, url in enumerate(urls_to_process, 1):
-            try:
-                print(f"  [{i}/{len(urls_to_process)}]", end="")
-                rec = await extract_listing_details(url)
-                if rec and rec.get('vehicle'):
-                    rows.append(rec)
-                    page_results.append(rec)
-                    # Save immediately (pass full record)
-                    save_to_leads([rec], 'piston_heads')
-            except Exception as exc:
-                print(f" ❌ Error: {exc}")
-            
-            # Rate limiting
-            if i < len(urls_to_process):
-                await asyncio.sleep(2)
+        for url, rec in zip(urls_to_process, results):
+            if isinstance(rec, Exception):
+                print(f"  ❌ Error on {url}: {rec}")
+            elif rec and rec.get('vehicle'):
+                page_results.append(rec)
+        
+        # Save the page in one batched upsert instead of one call per listing,
+        # in a worker thread so the blocking DB call overlaps the next page
+        if page_results:
+            total_listings += len(page_results)
+            if save_task:
+                await save_task
+            save_task = asyncio.create_task(asyncio.to_thread(save_to_raw_source, page_results, 'piston_heads'))
         
         print(f"\n✅ Page {current_page} complete: {len(page_results)} valid listings")
         
         pages_processed += 1
         current_page += 1
         
-        # Update search URL for next iteration
+        # Rate limiting between pages
         if pages_processed < batch_pages:
-            search_url = (
-                f"https://www.pistonheads.com/buy/search"
-                f"?price=0&price=2000&seller-type=Trade"
-                f"&page={current_page}"
-            )
-            
-            # Rate limiting between pages
             await asyncio.sleep(3)
     
+    if save_task:
+        await save_task
+    
     print(f"\n{'='*60}")
     print(f"✅ PistonHeads scraping complete!")
-    print(f"📊 Total listings collected: {len(rows)}")
+    print(f"📊 Total listings collected: {total_listings}")
+    print(f"⏭️ Already in the database: {skipped_listings}")
     print(f"📄 Pages processed: {pages_processed}")
     print(f"📄 Last page: {current_page - 1}")
     print(f"{'='*60}")
     
-    return rows
+    return total_listings + skipped_listings
 
 # ──────────────────────────────────────────────────────────────
 #  CLI TEST
@@ -451,9 +496,10 @@ if __name__ == "__main__":
         targets = sys.argv[1:]
         async def _single(urls):
             results = []
-            for url in urls:
-                result = await extract_listing_details(url)
-                results.append(result)
+            async with _new_crawler() as crawler:
+                for url in urls:
+                    result = await extract_listing_details(crawler, url)
+                    results.append(result)
             return results
         
         results = asyncio.run(_single(targets))
@@ -467,9 +513,6 @@ if __name__ == "__main__":
             start_page = 1
             batch_pages = 2
             
-        demo_rows = asyncio.run(run_pistonheads(batch_pages=batch_pages, start_page=start_page))
-        if demo_rows:
-            print("\n📋 Sample data:")
-            print(json.dumps(demo_rows[:2], indent=2))
-        else:
+        demo_count = asyncio.run(run_pistonheads(batch_pages=batch_pages, start_page=start_page))
+        if not demo_count:
             print("❌ No data collected")
\ No newline at end of file